@@ -0,0 +1,119 @@
+"""
+Benchmarks of the preprocessing, clustering and record linkage, run with asv
+(https://asv.readthedocs.io)::
+
+    asv run
+    asv run --bench Preprocess
+
+The benchmarks run on synthetic county extracts (see puget.synthetic). They
+are generated once per size and kept in $PUGET_BENCHMARK_DATA (default: a
+puget_benchmarks folder in the temporary directory). The largest sizes take a
+while to generate and need several GB of memory.
+"""
+import os
+import os.path as op
+import tempfile
+import warnings
+
+import puget.cluster as pcl
+import puget.preprocess as pp
+import puget.recordlinkage as prl
+import puget.synthetic as ps
+
+DATA_DIR = os.environ.get('PUGET_BENCHMARK_DATA',
+                          op.join(tempfile.gettempdir(), 'puget_benchmarks'))
+PATHS = ['2014', '2015', '2016']
+
+LINK_LIST = [{'block_variable': 'lname',
+              'match_variables': {'fname': 'string', 'ssn_as_str': 'string',
+                                  'dob': 'date'}},
+             {'block_variable': 'fname',
+              'match_variables': {'lname': 'string', 'ssn_as_str': 'string',
+                                  'dob': 'date'}},
+             {'block_variable': 'ssn_as_str',
+              'match_variables': {'fname': 'string', 'lname': 'string',
+                                  'dob': 'date'}}]
+
+
+def county_dir(n_clients):
+    """Folder of a synthetic county with n_clients people."""
+    data_dir = op.join(DATA_DIR, 'county_%d' % n_clients)
+    done_file = op.join(data_dir, 'done')
+    if not op.exists(done_file):
+        ps.make_county(data_dir, PATHS, n_clients=n_clients, seed=0)
+        open(done_file, 'w').close()
+    return data_dir
+
+
+class Preprocess(object):
+    """
+    Cleaning and merging of the tables. The Disabilities table, the largest,
+    has about 18 rows per client, so the tables range from 10k to about 20M
+    rows.
+    """
+    params = [1000, 10000, 100000, 1000000]
+    param_names = ['n_clients']
+    timeout = 3600
+
+    def setup(self, n_clients):
+        warnings.simplefilter('ignore')
+        self.data_dir = county_dir(n_clients)
+
+    def time_get_client(self, n_clients):
+        pp.get_client(data_dir=self.data_dir, paths=PATHS)
+
+    def peakmem_get_client(self, n_clients):
+        pp.get_client(data_dir=self.data_dir, paths=PATHS)
+
+    def time_get_income(self, n_clients):
+        pp.get_income(data_dir=self.data_dir, paths=PATHS)
+
+    def peakmem_get_income(self, n_clients):
+        pp.get_income(data_dir=self.data_dir, paths=PATHS)
+
+    def time_get_disabilities(self, n_clients):
+        pp.get_disabilities(data_dir=self.data_dir, paths=PATHS)
+
+    def time_merge_tables(self, n_clients):
+        pp.merge_tables(data_dir=self.data_dir, paths=PATHS, groups=False)
+
+    def peakmem_merge_tables(self, n_clients):
+        pp.merge_tables(data_dir=self.data_dir, paths=PATHS, groups=False)
+
+
+class Cluster(object):
+    """Clustering of the people in family enrollments."""
+    params = [1000, 10000]
+    param_names = ['n_clients']
+    timeout = 3600
+
+    def setup(self, n_clients):
+        warnings.simplefilter('ignore')
+        self.df = pp.get_enrollment(data_dir=county_dir(n_clients),
+                                    paths=PATHS)
+
+    def time_cluster_groups(self, n_clients):
+        pcl.cluster(self.df.copy(), 'PersonalID', group_var='HouseholdID')
+
+    def peakmem_cluster_groups(self, n_clients):
+        pcl.cluster(self.df.copy(), 'PersonalID', group_var='HouseholdID')
+
+    def time_cluster_time(self, n_clients):
+        pcl.cluster(self.df.reset_index(drop=True), 'PersonalID',
+                    time_var=['EntryDate'])
+
+
+class LinkRecords(object):
+    """Record linkage of people recorded several times."""
+    params = [1000, 10000, 100000]
+    param_names = ['n_people']
+    timeout = 3600
+
+    def setup(self, n_people):
+        self.df = ps.make_linkage_records(n_people, seed=0)
+
+    def time_link_records(self, n_people):
+        prl.link_records(self.df.copy(), LINK_LIST)
+
+    def peakmem_link_records(self, n_people):
+        prl.link_records(self.df.copy(), LINK_LIST)
@@ -2,6 +2,10 @@
 from . import utils
 from . import preprocess
 from . import cluster
+from . import cache
+from . import metadata
+from . import instrument
+from . import synthetic
 from .version import __version__
 import os.path as op
 from .data import DATA_PATH
@@ -0,0 +1,112 @@
+"""
+On-disk cache of cleaned tables.
+
+Tables are stored in a typed columnar format (Parquet), so that reloading them
+preserves dtypes (timestamps, nullable codes, categories) and is much faster
+than parsing and cleaning the raw csv files again. Writing and reading the
+cache requires a Parquet engine for pandas (pyarrow or fastparquet).
+
+Cache entries are keyed by a hash of everything that determines the table:
+the function arguments, the size & modification time of the raw data files
+and the contents of the (small) metadata files.
+"""
+import hashlib
+import json
+import os
+import os.path as op
+import tempfile
+import warnings
+
+import pandas as pd
+
+from .version import __version__
+
+
+def file_fingerprint(fname, hash_content=False):
+    """
+    Summarize the state of a file for use in a cache key.
+
+    Parameters
+    ----------
+    fname : string
+        full path to the file
+
+    hash_content : boolean
+        If true, include a hash of the file contents. Otherwise only the size
+        and modification time are used (cheap for large raw data files).
+
+    Returns
+    ----------
+    dict with the size, modification time (and content hash) of the file
+    """
+    stat = os.stat(fname)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if hash_content:
+        with open(fname, 'rb') as f:
+            fingerprint['sha256'] = hashlib.sha256(f.read()).hexdigest()
+    return fingerprint
+
+
+def cache_key(inputs):
+    """
+    Create a key from a dict of inputs.
+
+    Values that can't be represented in JSON are represented by their repr.
+    The puget version is always included, so that a new version doesn't reuse
+    tables cleaned by older code.
+
+    Returns
+    ----------
+    string with the hex digest of the inputs
+    """
+    inputs = dict(inputs, puget_version=__version__)
+    serialized = json.dumps(inputs, sort_keys=True, default=repr)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def cache_path(cache_dir, name, key):
+    """Full path of the cache file for a table name & key."""
+    return op.join(cache_dir, '%s_%s.parquet' % (name, key[:24]))
+
+
+def read_cached(fname):
+    """
+    Read a cached table.
+
+    Returns
+    ----------
+    dataframe, or None if there is no cached table in fname
+    """
+    if not op.exists(fname):
+        return None
+    return pd.read_parquet(fname)
+
+
+def write_cached(df, fname):
+    """
+    Write a table to the cache.
+
+    The table is written to a temporary file that is then moved into place,
+    so that concurrent readers never see a partially written file. Tables
+    that can't be stored in Parquet (e.g. columns with mixed types) are not
+    cached, with a warning.
+
+    Returns
+    ----------
+    True if the table was written, False otherwise
+    """
+    cache_dir = op.dirname(fname)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_fname = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(temp_fname)
+    except ImportError:
+        os.remove(temp_fname)
+        raise
+    except Exception as e:
+        os.remove(temp_fname)
+        warnings.warn('Could not cache table in %s: %s' % (fname, e))
+        return False
+    os.replace(temp_fname, fname)
+    return True
@@ -1,11 +1,14 @@
 """
 
 """
+import itertools
 import numpy as np
 import pandas as pd
-import itertools
-from scipy.sparse import csr_matrix
-import networkx as nx
+from scipy.sparse import csr_matrix, coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Number of edges merged into the union-find at a time when streaming
+EDGE_CHUNK_SIZE = 1000000
 
 
 def make_mapping(unique_individuals):
@@ -29,11 +32,21 @@ def make_mapping(unique_individuals):
     return mapping
 
 
+def _individual_indices(df, individual_var, mapping):
+    """Indices (through mapping) of the individual of each row of df."""
+    individuals = pd.Index(np.array(list(mapping.keys())))
+    indices = np.array(list(mapping.values()))
+    return indices[individuals.get_indexer(df[individual_var])]
+
+
 def groups_co_occurrence(df, individual_var, group_var, T=None,
                          mapping=None, sparse=None):
     """
     Count the co-occurrence of individuals in a group.
 
+    The counts are computed as the product of the individual x group
+    incidence matrix with its transpose, as sparse matrices.
+
     Parameters
     ----------
     df : DataFrame
@@ -46,10 +59,10 @@ def groups_co_occurrence(df, individual_var, group_var, T=None,
         The variable (column) that identifies groups. This is the clustering
         variable.
 
-    T : ndarray, optional
-        If provided, this is a matrix that defines the unweighted graph of
-        connections between individuals. Default: None, which implies that
-        a matrix of zeros is initialized.
+    T : ndarray or sparse matrix, optional
+        If provided, the co-occurrences are added to this matrix, which
+        defines the unweighted graph of connections between individuals.
+        Default: None, which implies that a matrix of zeros is initialized.
 
     mapping : dict, optional
         If provided, defines a mapping between individual identifiers and
@@ -65,47 +78,46 @@ def groups_co_occurrence(df, individual_var, group_var, T=None,
     (mapped through mapping and inv_mapping) have appeared together in the
     same group.
     """
-    unique_individuals = df[individual_var].unique()
-    if T is None:
-        if not sparse:
-            T = np.zeros((unique_individuals.shape[0],
-                          unique_individuals.shape[0]))
     if mapping is None:
-        mapping = make_mapping(unique_individuals)
-    else:
-        mapping = mapping
-    gb = df.groupby(group_var)
+        mapping = make_mapping(df[individual_var].unique())
+    n_individuals = len(mapping)
+
+    # Incidence matrix with a 1 for each individual in each group. Rows with
+    # a missing group are not in any group.
+    in_group = df[group_var].notnull().values
+    individuals = _individual_indices(df, individual_var, mapping)[in_group]
+    groups, group_ids = pd.factorize(df[group_var].values[in_group])
+    incidence = coo_matrix((np.ones(individuals.shape[0]),
+                            (individuals, groups)),
+                           shape=(n_individuals, group_ids.shape[0])).tocsr()
+    # Individuals with several rows in a group count once
+    incidence.data[:] = 1
+
+    co_occurrence = (incidence @ incidence.T).tocsr()
+    co_occurrence.setdiag(0)
+    co_occurrence.eliminate_zeros()
 
     if sparse:
-        rows = []
-        cols = []
-        for gid, group in gb:
-            ids = group[individual_var].unique()
-            pairs = itertools.permutations(ids, 2)
-            for pair in pairs:
-                rows.append(mapping[pair[0]])
-                cols.append(mapping[pair[1]])
-        T = csr_matrix((np.ones(len(cols)), (rows, cols)))
-    else:
-        for gid, group in gb:
-            ids = group[individual_var].unique()
-            pairs = itertools.permutations(ids, 2)
-            rows = []
-            cols = []
-            for pair in pairs:
-                rows.append(mapping[pair[0]])
-                cols.append(mapping[pair[1]])
-            T[rows, cols] = T[rows, cols] + 1
-
+        if T is not None:
+            co_occurrence = co_occurrence + T
+        return co_occurrence
 
+    if T is None:
+        T = np.zeros((n_individuals, n_individuals))
+    co_occurrence = co_occurrence.tocoo()
+    T[co_occurrence.row, co_occurrence.col] += co_occurrence.data
     return T
 
 
 def time_co_occurrence(df, individual_var, time_var, time_unit='ns',
-                       time_delta=0, T=None, mapping=None):
+                       time_delta=0, T=None, mapping=None, sparse=False):
     """
     Group by co-occurrence of the times of enrollment (entry, exit).
 
+    The pairs of records within time_delta of each other are found by sorting
+    the times and sweeping over them, so this takes O(n log n + pairs) time
+    and memory rather than comparing all pairs of records.
+
     Parameters
     ----------
     time_var : list
@@ -117,38 +129,224 @@ def time_co_occurrence(df, individual_var, time_var, time_unit='ns',
     time_delta : float or int
         How many of the time-unit is still considered "co-occurrence"?
         (default: 0).
+
+    T : ndarray or sparse matrix, optional
+        If provided, the co-occurrences are added to this matrix.
+
+    mapping : dict, optional
+        If provided, defines a mapping between individual identifiers and
+        indices in the T array.
+
+    sparse : bool, optional
+        Whether to return a sparse CSR matrix. Default: False.
+
+    Returns
+    -------
+    Matrix with the number of time variables in which individuals have
+    (at least once) co-occurred. Missing times don't co-occur with anything.
     """
-    unique_individuals = df[individual_var].unique()
-    if T is None:
-        T = np.zeros((unique_individuals.shape[0],
-                      unique_individuals.shape[0]))
     if mapping is None:
-        mapping = make_mapping(unique_individuals)
-    else:
-        mapping = mapping
+        mapping = make_mapping(df[individual_var].unique())
+    n_individuals = len(mapping)
+    individuals = _individual_indices(df, individual_var, mapping)
+    dt0 = np.timedelta64(time_delta, time_unit).astype('timedelta64[ns]')
 
-    # We'll identify differences as things smaller than this:
-    dt0 = np.timedelta64(time_delta, time_unit)
+    co_occurrence = csr_matrix((n_individuals, n_individuals))
     for tv in time_var:
-        df[tv]
-        # Broadcast and get pairwise time-differences:
-        diff = np.array(df[tv])[:, None] - np.array(df[tv])[:, None].T
-        # Anything larger than the time_delta would do here:
-        diff[pd.isnull(diff)] = np.timedelta64(time_delta + 1, 'ns')
-        idx = np.where(np.abs(diff) <= dt0)
-        rows = [mapping[ii] for ii in df[individual_var][idx[0]]]
-        cols = [mapping[ii] for ii in df[individual_var][idx[1]]]
-        # Increment the co-occurence matrix where relevant:
-        T[rows, cols] = T[rows, cols] + 1
+        rows, cols = _time_pairs(df[tv], dt0)
+        rows, cols = individuals[rows], individuals[cols]
+        pairs = coo_matrix((np.ones(2 * rows.shape[0]),
+                            (np.concatenate([rows, cols]),
+                             np.concatenate([cols, rows]))),
+                           shape=(n_individuals, n_individuals)).tocsr()
+        # Count each pair of individuals once per time variable
+        pairs.data[:] = 1
+        co_occurrence = co_occurrence + pairs
 
     # Enforce self-to-self co-occurence of zero (consistent with group
     # clustering):
-    np.fill_diagonal(T, 0)
+    co_occurrence.setdiag(0)
+    co_occurrence.eliminate_zeros()
+
+    if sparse:
+        if T is not None:
+            co_occurrence = co_occurrence + T
+        return co_occurrence
+
+    if T is None:
+        T = np.zeros((n_individuals, n_individuals))
+    co_occurrence = co_occurrence.tocoo()
+    T[co_occurrence.row, co_occurrence.col] += co_occurrence.data
     return T
 
 
+def _time_pairs(times, time_delta):
+    """
+    Find all pairs of records whose times are at most time_delta apart.
+
+    Parameters
+    ----------
+    times : Series
+        times of the records
+
+    time_delta : timedelta64
+
+    Returns
+    -------
+    Two arrays with the positions of the first & second record of each pair
+    (each pair once, the first record before the second in time order)
+    """
+    times = pd.to_datetime(times).values.astype('datetime64[ns]')
+    valid = np.flatnonzero(~np.isnat(times))
+    order = valid[np.argsort(times[valid], kind='mergesort')]
+    sorted_times = times[order].view(np.int64)
+
+    # each record pairs with the following records up to the first one that
+    # is more than time_delta later
+    stop = np.searchsorted(sorted_times,
+                           sorted_times + time_delta.astype(np.int64),
+                           side='right')
+    n_pairs = stop - np.arange(sorted_times.shape[0]) - 1
+    first = np.repeat(np.arange(sorted_times.shape[0]), n_pairs)
+    # offset of each pair within the pairs of its first record
+    offset = np.arange(first.shape[0]) - np.repeat(np.cumsum(n_pairs) -
+                                                   n_pairs, n_pairs)
+    second = first + 1 + offset
+    return order[first], order[second]
+
+
+def group_edges(df, individual_var, group_var, mapping,
+                chunk_size=EDGE_CHUNK_SIZE):
+    """
+    Generate edges between individuals that co-occur in a group.
+
+    Only the edges from each individual to the first individual of each of
+    its groups are generated. These connect the same individuals as all the
+    pairs within the groups, with a number of edges that is linear in the
+    number of rows.
+
+    Parameters
+    ----------
+    df : DataFrame
+    individual_var : string
+    group_var : string
+    mapping : dict
+        A mapping between individual identifiers and indices
+    chunk_size : int, optional
+        The number of edges to yield at a time
+
+    Yields
+    ------
+    Two arrays with the indices of the individuals at both ends of the edges
+    """
+    in_group = df[group_var].notnull().values
+    individuals = _individual_indices(df, individual_var, mapping)[in_group]
+    groups = pd.factorize(df[group_var].values[in_group])[0]
+    _, first_in_group = np.unique(groups, return_index=True)
+    firsts = individuals[first_in_group][groups]
+    for start in range(0, individuals.shape[0], chunk_size):
+        yield (individuals[start:start + chunk_size],
+               firsts[start:start + chunk_size])
+
+
+def time_edges(df, individual_var, time_var, mapping, time_unit='ns',
+               time_delta=0, chunk_size=EDGE_CHUNK_SIZE):
+    """
+    Generate edges between individuals that co-occur in time.
+
+    Only the edges between records that are next to each other in time (and
+    within time_delta) are generated. Any two records within time_delta are
+    connected through such edges, so these connect the same individuals as
+    all the pairs found by time_co_occurrence, with a number of edges that is
+    linear in the number of rows.
+
+    Parameters
+    ----------
+    df : DataFrame
+    individual_var : string
+    time_var : list
+    mapping : dict
+        A mapping between individual identifiers and indices
+    time_unit : string
+    time_delta : float or int
+    chunk_size : int, optional
+        The number of edges to yield at a time
+
+    Yields
+    ------
+    Two arrays with the indices of the individuals at both ends of the edges
+    """
+    individuals = _individual_indices(df, individual_var, mapping)
+    dt0 = np.timedelta64(time_delta, time_unit).astype('timedelta64[ns]')
+    for tv in time_var:
+        times = pd.to_datetime(df[tv]).values.astype('datetime64[ns]')
+        valid = np.flatnonzero(~np.isnat(times))
+        order = valid[np.argsort(times[valid], kind='mergesort')]
+        close = np.diff(times[order]) <= dt0
+        first = individuals[order[:-1][close]]
+        second = individuals[order[1:][close]]
+        for start in range(0, first.shape[0], chunk_size):
+            yield (first[start:start + chunk_size],
+                   second[start:start + chunk_size])
+
+
+def union_find_labels(n_individuals, edges):
+    """
+    Find the connected components of a stream of edges.
+
+    The components are kept as a forest: each individual points to a parent
+    in its component, and the root of each tree stands for the component.
+    Each chunk of edges only looks up and re-links the roots of the
+    individuals it touches, so its cost scales with its number of edges,
+    and all the individuals are labelled once at the end. The memory used
+    scales with the number of individuals plus the size of a chunk.
+
+    Parameters
+    ----------
+    n_individuals : int
+    edges : iterable
+        Pairs of arrays with the indices of the individuals at both ends of
+        the edges (e.g. from group_edges and time_edges)
+
+    Returns
+    -------
+    Array with the component of each individual, numbered from 0 in the
+    order of the first individual of each component
+    """
+    parent = np.arange(n_individuals)
+    for first, second in edges:
+        # Find the roots of the individuals of the chunk, compressing their
+        # paths to point directly to them
+        touched, ends = np.unique(np.concatenate([first, second]),
+                                  return_inverse=True)
+        roots = _find_roots(parent, parent[touched])
+        parent[touched] = roots
+        # Merge the trees that the edges connect, under their smallest root
+        tree_roots, tree_ends = np.unique(roots[ends], return_inverse=True)
+        n_trees = tree_roots.shape[0]
+        graph = coo_matrix((np.ones(first.shape[0], dtype=np.int8),
+                            (tree_ends[:first.shape[0]],
+                             tree_ends[first.shape[0]:])),
+                           shape=(n_trees, n_trees)).tocsr()
+        n_components, components = connected_components(graph,
+                                                        directed=False)
+        new_roots = np.full(n_components, n_individuals)
+        np.minimum.at(new_roots, components, tree_roots)
+        parent[tree_roots] = new_roots[components]
+    return pd.factorize(_find_roots(parent, parent))[0]
+
+
+def _find_roots(parent, nodes):
+    """Follow the parents of the nodes up to the roots of their trees."""
+    while True:
+        grandparents = parent[nodes]
+        if np.array_equal(grandparents, nodes):
+            return nodes
+        nodes = grandparents
+
+
 def cluster(df, individual_var, group_var=None, time_var=None, time_unit='ns',
-            time_delta=0, sparse=False):
+            time_delta=0, sparse=False, streaming=False):
     """
     Calculate clusters from a co-occurrence matrix
 
@@ -166,9 +364,30 @@ def cluster(df, individual_var, group_var=None, time_var=None, time_unit='ns',
     sparse : bool, optional
         Whether to use a sparse CSR matrix to represent the graph. This may
         slow things down, but might be necessary for really large datasets.
+    streaming : bool, optional
+        Whether to find the clusters from streams of edges (see group_edges
+        and time_edges) with a union-find, without building a co-occurrence
+        matrix. The clusters are the same, but the memory used only scales
+        with the number of individuals and rows. sparse is ignored.
     """
     unique_individuals = df[individual_var].unique()
 
+    if streaming:
+        mapping = make_mapping(unique_individuals)
+        edges = []
+        if group_var is not None:
+            edges = itertools.chain(edges, group_edges(df, individual_var,
+                                                       group_var, mapping))
+        if time_var is not None:
+            edges = itertools.chain(edges, time_edges(df, individual_var,
+                                                      time_var, mapping,
+                                                      time_unit=time_unit,
+                                                      time_delta=time_delta))
+        labels = union_find_labels(len(mapping), edges)
+        df['cluster'] = labels.astype(np.int64)[
+            _individual_indices(df, individual_var, mapping)] + 1
+        return df
+
     if sparse:
         T = None
     else:
@@ -182,24 +401,17 @@ def cluster(df, individual_var, group_var=None, time_var=None, time_unit='ns',
                                  mapping=mapping, sparse=sparse)
 
     if time_var is not None:
-        if sparse:
-            raise NotImplementedError("""Can't use sparse matrices with
-                                         time variable""")
         T = time_co_occurrence(df, individual_var, time_var,
                                time_unit=time_unit,
                                time_delta=time_delta,
-                               T=T, mapping=mapping)
+                               T=T, mapping=mapping, sparse=sparse)
 
-    clusters = {}
+    # Components are labeled in the order of their first individual (in
+    # mapping order), starting at 1
     if not sparse:
-        T[np.tril_indices(T.shape[0])] = 0
-        G = nx.Graph(T)
-    else:
-        G = nx.from_scipy_sparse_matrix(T)
-
-    for i, c in enumerate(nx.connected_components(G)):
-        for j in c:
-            clusters[j] = i + 1
+        T = csr_matrix(T)
+    n_clusters, labels = connected_components(T, directed=False)
 
-    df['cluster'] = df[individual_var].apply(lambda x: clusters[mapping[x]])
+    df['cluster'] = labels.astype(np.int64)[
+        _individual_indices(df, individual_var, mapping)] + 1
     return df
@@ -0,0 +1,160 @@
+"""
+Timing and memory instrumentation of processing stages.
+
+Functions in puget record their stages (reading, deduplication, cleaning of
+each table, each merge, ...) with `stage`. Nothing is recorded unless a
+StageReport is active, so the instrumentation costs next to nothing when it
+isn't used::
+
+    with StageReport() as report:
+        df = preprocess.merge_tables(county='king')
+    print(report.to_frame())
+
+Each record has the name of the stage, the name of the stage it is part of
+(parent), the wall time & CPU time in seconds, the increase of the peak
+resident memory of the process in bytes (peak_rss_delta, None if it can't be
+measured on this platform) and, when the stage produces a table, its number
+of rows & columns. Records are also passed to the optional callback of the
+report and logged to the 'puget.instrument' logger at DEBUG level.
+"""
+import contextvars
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RECORD_COLUMNS = ['stage', 'parent', 'table', 'wall_time', 'cpu_time',
+                  'peak_rss_delta', 'n_rows', 'n_columns']
+
+# The active report and the record of the stage that is running
+_active = contextvars.ContextVar('puget_instrument', default=None)
+
+
+class StageReport(object):
+    """
+    Collects the records of the stages that run while it is active.
+
+    Parameters
+    ----------
+    callback : callable
+        If provided, called with each record (a dict) as it is added.
+        Default is None.
+    """
+    def __init__(self, callback=None):
+        self.records = []
+        self.callback = callback
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_active.set((self, None)))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.reset(self._tokens.pop())
+
+    def add(self, record):
+        """Add a record, e.g. one made in another process."""
+        self.records.append(record)
+        logger.debug('%s', record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def to_frame(self):
+        """
+        Returns
+        ----------
+        dataframe with one row per record, in the order the stages finished
+        """
+        return pd.DataFrame(self.records, columns=RECORD_COLUMNS)
+
+
+def is_active():
+    """Whether a StageReport is recording stages."""
+    return _active.get() is not None
+
+
+@contextmanager
+def stage(name, table=None):
+    """
+    Record the time and memory used by a stage.
+
+    Parameters
+    ----------
+    name : string
+        name of the stage
+
+    table : string
+        name of the table the stage works on, if any. Nested stages inherit
+        the table of the enclosing stage. Default is None.
+
+    Yields
+    ----------
+    the record (a dict) of the stage. Call set_shape on it to record the size
+    of the table the stage produces.
+    """
+    state = _active.get()
+    if state is None:
+        yield {}
+        return
+
+    report, parent = state
+    if table is None and parent is not None:
+        table = parent['table']
+    record = {'stage': name,
+              'parent': None if parent is None else parent['stage'],
+              'table': table, 'n_rows': None, 'n_columns': None}
+    token = _active.set((report, record))
+    peak_rss = _peak_rss()
+    wall_time = time.perf_counter()
+    cpu_time = time.process_time()
+    try:
+        yield record
+    finally:
+        _active.reset(token)
+    record['wall_time'] = time.perf_counter() - wall_time
+    record['cpu_time'] = time.process_time() - cpu_time
+    if peak_rss is not None:
+        record['peak_rss_delta'] = _peak_rss() - peak_rss
+    else:
+        record['peak_rss_delta'] = None
+    report.add(record)
+
+
+def set_shape(record, df):
+    """Record the number of rows & columns of a dataframe in a record."""
+    record['n_rows'], record['n_columns'] = df.shape
+
+
+def _peak_rss():
+    """Peak resident memory of the process in bytes, None if unknown."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on macOS, in kilobytes elsewhere
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    return peak_rss
+
+
+def add_records(records):
+    """
+    Add records made elsewhere (e.g. in another process) to the active
+    report, as part of the running stage.
+    """
+    state = _active.get()
+    if state is None:
+        return
+    report, parent = state
+    for record in records:
+        if record['parent'] is None and parent is not None:
+            record = dict(record, parent=parent['stage'])
+        report.add(record)
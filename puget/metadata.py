@@ -0,0 +1,145 @@
+"""
+Registry of the JSON metadata files that describe the HMIS tables.
+
+Each metadata file is parsed and validated once and kept as a TableSchema,
+whose ID columns and lists of columns are attributes::
+
+    schema = metadata.get_schema(METADATA_FILES['client'])
+    schema.person_ID, schema.duplicate_check_columns
+
+The registry is keyed by the full path of the file and invalidated when the
+size or modification time of the file changes. Schemas are shared, so they
+must not be modified: the lists of columns are exposed as tuples, and
+`to_dict` returns a new copy of the metadata for functions that modify it.
+"""
+import copy
+import json
+import os
+import os.path as op
+import threading
+
+# Types of the known metadata fields. Other fields (e.g. the stage values of
+# entry/exit tables or the codes of mapping files) are kept as they are.
+ID_FIELDS = ['person_ID', 'person_enrollment_ID', 'program_ID',
+             'groupID_column', 'dob_column', 'entry_date',
+             'destination_column', 'project_type_column',
+             'collection_stage_column', 'type_column', 'response_column']
+COLUMN_LIST_FIELDS = ['duplicate_check_columns', 'columns_to_drop',
+                      'categorical_var', 'time_var', 'boolean',
+                      'numeric_code', 'name_columns', 'columns_to_take_max']
+
+_registry = {}
+_lock = threading.Lock()
+
+
+class TableSchema(object):
+    """
+    The parsed contents of a metadata file.
+
+    Parameters
+    ----------
+    metadata : dict
+        The contents of the metadata file, including its name.
+
+    metadata_file : string
+        full path to the metadata file, used in error messages.
+        Default is None.
+
+    Attributes
+    ----------
+    name : string
+        name of the metadata (e.g. the table it describes)
+
+    person_ID, person_enrollment_ID, ... : string, list or None
+        names of the ID & special columns (see ID_FIELDS), None if the table
+        doesn't have them
+
+    duplicate_check_columns, categorical_var, ... : tuple
+        lists of columns (see COLUMN_LIST_FIELDS), empty if not given
+    """
+    def __init__(self, metadata, metadata_file=None):
+        _validate(metadata, metadata_file)
+        self.metadata_file = metadata_file
+        self._metadata = copy.deepcopy(metadata)
+        self.name = self._metadata.pop('name')
+        for field in ID_FIELDS:
+            setattr(self, field, self._metadata.get(field))
+        for field in COLUMN_LIST_FIELDS:
+            setattr(self, field, tuple(self._metadata.get(field, ())))
+
+    def __contains__(self, field):
+        return field in self._metadata
+
+    def __getitem__(self, field):
+        return copy.deepcopy(self._metadata[field])
+
+    def __repr__(self):
+        return 'TableSchema(%r, %r)' % (self.name, self.metadata_file)
+
+    def to_dict(self):
+        """
+        Returns
+        ----------
+        a new dict with the metadata, without its name
+        """
+        return copy.deepcopy(self._metadata)
+
+
+def _validate(metadata, metadata_file):
+    """Check the types of the known fields of a metadata dict."""
+    if not isinstance(metadata, dict):
+        raise ValueError('Metadata file %s should contain a JSON object' %
+                         metadata_file)
+    if not isinstance(metadata.get('name'), str):
+        raise ValueError('Metadata file %s should have a name' %
+                         metadata_file)
+    for field in ID_FIELDS:
+        # IDs made of several columns are lists
+        if field in metadata and not (isinstance(metadata[field], str) or
+                                      _is_column_list(metadata[field])):
+            raise ValueError('%s in metadata file %s should be a column name'
+                             % (field, metadata_file))
+    for field in COLUMN_LIST_FIELDS:
+        if field in metadata and not _is_column_list(metadata[field]):
+            raise ValueError('%s in metadata file %s should be a list of '
+                             'column names' % (field, metadata_file))
+
+
+def _is_column_list(value):
+    return isinstance(value, list) and all(isinstance(col, str)
+                                           for col in value)
+
+
+def get_schema(metadata_file):
+    """
+    Get the schema of a metadata file, parsing it only if it is not in the
+    registry or has changed since it was parsed.
+
+    Parameters
+    ----------
+    metadata_file : string
+        full path to the JSON metadata file
+
+    Returns
+    ----------
+    TableSchema
+    """
+    metadata_file = op.abspath(metadata_file)
+    stat = os.stat(metadata_file)
+    fingerprint = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        cached = _registry.get(metadata_file)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    with open(metadata_file) as f:
+        schema = TableSchema(json.load(f), metadata_file)
+    with _lock:
+        _registry[metadata_file] = (fingerprint, schema)
+    return schema
+
+
+def clear_registry():
+    """Forget all the parsed metadata files."""
+    with _lock:
+        _registry.clear()
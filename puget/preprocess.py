@@ -30,8 +30,17 @@ import datetime
 import os.path as op
 import numpy as np
 import json
+import os
+import re
+import inspect
+import tempfile
 import puget.utils as pu
+import puget.cache as pc
+import puget.instrument as pi
+import puget.metadata as pm
 import warnings
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
 
 from puget.data import DATA_PATH
 
@@ -62,6 +71,16 @@ METADATA_FILES = {'enrollment': 'enrollment.json',
 for k, v in METADATA_FILES.items():
     METADATA_FILES[k] = op.join(DATA_PATH, 'metadata', v)
 
+# dict of default raw data file names
+TABLE_FILES = {'enrollment': 'Enrollment.csv',
+               'exit': 'Exit.csv',
+               'client': 'Client.csv',
+               'disabilities': 'Disabilities.csv',
+               'employment_education': 'EmploymentEducation.csv',
+               'health_dv': 'HealthAndDV.csv',
+               'income': 'IncomeBenefits.csv',
+               'project': 'Project.csv'}
+
 
 file_path_boilerplate = (
     """
@@ -119,11 +138,56 @@ def std_path_setup(filename, data_dir, paths):
     return file_spec
 
 
+def _resolve_file_spec(file_spec, county=None, data_dir=None, paths=None):
+    """
+    Get the dict of folders & full file paths that read_table reads from.
+
+    Parameters
+    ----------
+    %s
+
+    Returns
+    ----------
+    dict with key of paths, value of filenames for all included folders
+    """
+    if not isinstance(file_spec, dict):
+        if data_dir is None:
+            if county is None:
+                raise ValueError('If file_spec is a string, data_dir or ' +
+                                 'county must be passed')
+            else:
+                if not isinstance(county, str):
+                    raise ValueError('county must be a string -- '
+                                     'one county at a time, please!')
+                data_dir = op.join(DATA_PATH, county)
+        if paths is None:
+            if county is None:
+                raise ValueError('If file_spec is a string, paths or county ' +
+                                 'must be passed')
+            else:
+                if not isinstance(county, str):
+                    raise ValueError('county must be a string -- '
+                                     'one county at a time, please!')
+                paths = COUNTY_FOLDERS[county]
+
+        file_spec = std_path_setup(file_spec, data_dir, paths)
+    else:
+        if data_dir is not None or paths is not None:
+            raise ValueError(
+                'If file_spec is a dict, data_dir and paths cannot be passed')
+
+    return file_spec
+
+_resolve_file_spec.__doc__ = _resolve_file_spec.__doc__ % file_path_boilerplate
+
+
 def read_table(file_spec, county=None, data_dir=None, paths=None,
                columns_to_drop=None, categorical_var=None,
                categorical_unknown=CATEGORICAL_UNKNOWN,
                time_var=None, duplicate_check_columns=None, dedup=True,
-               encoding=None, name_columns=None):
+               encoding=None, name_columns=None, source_column=None,
+               n_jobs=1, executor=None, dtype=None, nullable_int=False,
+               time_format=None):
     """
     Read in any .csv table from multiple folders in the raw data.
 
@@ -146,6 +210,15 @@ def read_table(file_spec, county=None, data_dir=None, paths=None,
         A list of time (variables) in yyyy-mm-dd format that are
         reformatted into pandas timestamps. Default is None.
 
+    time_format : string, list or dict
+        Date format(s) of the time_var columns, in strftime notation,
+        parsed with parse_time. Either one format or a list of formats
+        (tried in order) for all time_var columns, or a dict of column names
+        and their format(s). Columns without a format have their format
+        inferred.
+        A warning reports the number of values that didn't match any format.
+        Default is None (infer the format of all columns).
+
     duplicate_check_columns : list
         list of columns to conside in deduplication.
           Generally, duplicate rows may happen when the same record is
@@ -154,6 +227,31 @@ def read_table(file_spec, county=None, data_dir=None, paths=None,
     dedup: boolean
         flag to turn on/off deduplication. Defaults to True
 
+    source_column : string
+        If provided, name of a column to add that records which folder (key
+        of file_spec) each row was read from. Default is None.
+
+    dtype : dict
+        Column names and the dtypes to parse them as, e.g. 'Int8' (nullable
+        small integers) for yes/no codes, 'Int16' for code lists that have
+        3 digit codes or 'category' for repeated strings. A value that
+        doesn't fit in the declared dtype raises an error. Columns that are
+        not in the files are ignored. Default is None (the dtypes are
+        inferred).
+
+    nullable_int : boolean
+        If true, categorical_var columns with only integer values are
+        converted to nullable integers ('Int64') after the unknown values are
+        removed, instead of floats. Default is False.
+
+    n_jobs : int
+        Number of threads to use to parse the files of the different folders
+        concurrently. Default is 1 (one file after another).
+
+    executor : concurrent.futures.Executor
+        If provided, the files are parsed on this executor (e.g. a
+        ProcessPoolExecutor) and n_jobs is ignored. Default is None.
+
     Returns
     ----------
     dataframe of a csv tables from all included folders
@@ -164,52 +262,49 @@ def read_table(file_spec, county=None, data_dir=None, paths=None,
         categorical_var = []
     if time_var is None:
         time_var = []
+    if dtype is None:
+        dtype = {}
+    time_formats = _time_formats(time_var, time_format)
 
-    if not isinstance(file_spec, dict):
-        if data_dir is None:
-            if county is None:
-                raise ValueError('If file_spec is a string, data_dir or ' +
-                                 'county must be passed')
-            else:
-                if not isinstance(county, str):
-                    raise ValueError('county must be a string -- '
-                                     'one county at a time, please!')
-                data_dir = op.join(DATA_PATH, county)
-        if paths is None:
-            if county is None:
-                raise ValueError('If file_spec is a string, paths or county ' +
-                                 'must be passed')
-            else:
-                if not isinstance(county, str):
-                    raise ValueError('county must be a string -- '
-                                     'one county at a time, please!')
-                paths = COUNTY_FOLDERS[county]
-
-        file_spec = std_path_setup(file_spec, data_dir, paths)
-    else:
-        if data_dir is not None or paths is not None:
-            raise ValueError(
-                'If file_spec is a dict, data_dir and paths cannot be passed')
+    file_spec = _resolve_file_spec(file_spec, county=county, data_dir=data_dir,
+                                   paths=paths)
 
     file_spec_use = file_spec.copy()
 
-    # Start by reading the first file into a DataFrame
-    path, fname = file_spec_use.popitem()
-    df = pd.read_csv(fname, low_memory=False, encoding=encoding)
+    # Start with the first file, then the rest of the files
+    folder_items = [file_spec_use.popitem()] + list(file_spec_use.items())
+    read_args = ([path for path, fname in folder_items],
+                 [fname for path, fname in folder_items])
+    # Columns with a declared date format are parsed after reading
+    read_csv = partial(_read_folder_csv, encoding=encoding,
+                       source_column=source_column,
+                       dtype=dict({col: str for col in time_formats}, **dtype),
+                       columns_to_drop=columns_to_drop)
+
+    # Parse the files (concurrently if requested), then concatenate them all
+    # at once. map returns the results in order, so the result is
+    # deterministic regardless of which file finishes first.
+    with pi.stage('read') as record:
+        if executor is not None:
+            df_list = list(executor.map(read_csv, *read_args))
+        elif n_jobs > 1 and len(folder_items) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                df_list = list(pool.map(read_csv, *read_args))
+        else:
+            df_list = list(map(read_csv, *read_args))
+        df = pd.concat(df_list)
+        del df_list
+        pi.set_shape(record, df)
 
-    # Then, for the rest of the files, append to the DataFrame.
-    for path, fname in file_spec_use.items():
-        this_df = pd.read_csv(fname, low_memory=False, encoding=encoding)
-        df = df.append(this_df)
+    # Concatenating categoricals with different categories gives objects
+    for col, col_dtype in dtype.items():
+        if col in df.columns and str(df[col].dtype) != str(col_dtype):
+            df[col] = df[col].astype(col_dtype)
 
-    # Sometimes, column headers can have the unicode 'zero width no-break space
-    # character' (http://www.fileformat.info/info/unicode/char/FEFF/index.htm)
-    # appended to them (because, why not?). We eliminate that here:
-    for col in df.columns:
-        if col.startswith('\ufeff'):
-            df.rename(columns={col: col[1:]}, inplace=True)
+    df = _strip_bom(df)
 
-    # Drop unnecessary columns
+    # Drop unnecessary columns (read_csv already skips them, this only
+    # matters for headers it couldn't match, e.g. duplicated names)
     cols_drop_use = list(set(columns_to_drop).intersection(set(df.columns)))
     df = df.drop(cols_drop_use, axis=1)
 
@@ -219,20 +314,498 @@ def read_table(file_spec, county=None, data_dir=None, paths=None,
             warnings.warn('dedup is True but duplicate_check_columns is ' +
                           'None, no deduplication')
         else:
-            df = df.drop_duplicates(duplicate_check_columns, keep='last',
-                                    inplace=False)
+            with pi.stage('dedup') as record:
+                df = df.drop_duplicates(duplicate_check_columns, keep='last',
+                                        inplace=False)
+                pi.set_shape(record, df)
+
+    with pi.stage('clean_columns') as record:
+        df, n_failed = _clean_columns(df, categorical_var,
+                                      categorical_unknown, time_var,
+                                      time_formats=time_formats,
+                                      nullable_int=nullable_int)
+        pi.set_shape(record, df)
+    _warn_time_failures(n_failed)
+    return df
+
+read_table.__doc__ = read_table.__doc__ % file_path_boilerplate
 
-    # Turn values in categorical_unknown in any categorical_var into NaNs
-    for col in categorical_var:
-        df[col] = df[col].replace(categorical_unknown,
-                                  [np.NaN, np.NaN, np.NaN])
 
-    # Reformat yyyy-mm-dd variables to pandas timestamps
+def _strip_bom(df):
+    """
+    Remove the zero width no-break space from the start of column headers.
+
+    Sometimes, column headers can have the unicode 'zero width no-break space
+    character' (http://www.fileformat.info/info/unicode/char/FEFF/index.htm)
+    appended to them (because, why not?). We eliminate that here.
+    """
+    for col in df.columns:
+        if col.startswith('\ufeff'):
+            df.rename(columns={col: col[1:]}, inplace=True)
+    return df
+
+
+def mask_categorical_unknown(df, categorical_var,
+                             categorical_unknown=CATEGORICAL_UNKNOWN,
+                             nullable_int=False):
+    """
+    Set the values listed in categorical_unknown to NaN in all the
+    categorical_var columns at once.
+
+    Parameters
+    ----------
+    df : dataframe
+        dataframe with the categorical columns, modified in place
+
+    categorical_var : list
+        A list of categorical (including binary) variables
+
+    categorical_unknown: list
+        values that should be recorded as NaNs, of any length.
+        Default is CATEGORICAL_UNKNOWN (8, 9, 99)
+
+    nullable_int : boolean
+        If true, columns with only integer values are converted to nullable
+        integers ('Int64') rather than floats. Columns already parsed as a
+        nullable integer dtype keep their dtype. Default is False.
+
+    Returns
+    ----------
+    dataframe with the unknown values masked
+    """
+    categorical_var = list(categorical_var)
+    if len(categorical_var) == 0:
+        return df
+    block = df[categorical_var]
+    block = block.mask(block.isin(list(categorical_unknown)))
+
+    if nullable_int:
+        is_float = [pd.api.types.is_float_dtype(block[col])
+                    for col in categorical_var]
+        float_cols = [col for col, f in zip(categorical_var, is_float) if f]
+        if len(float_cols) > 0:
+            values = block[float_cols]
+            is_int = ((values % 1 == 0) | values.isnull()).all()
+            int_cols = list(is_int[is_int].index)
+            block[int_cols] = values[int_cols].astype('Int64')
+
+    df[categorical_var] = block
+    return df
+
+
+def _clean_columns(df, categorical_var, categorical_unknown, time_var,
+                   time_formats=None, nullable_int=False):
+    """
+    Set unknown categorical codes to NaN and convert time columns to
+    timestamps.
+
+    Returns
+    ----------
+    the cleaned dataframe and a dict with the number of values of each
+    time_var column in time_formats that didn't match any of the formats
+    """
+    # Turn values in categorical_unknown in any categorical_var into NaNs
+    df = mask_categorical_unknown(df, categorical_var, categorical_unknown,
+                                  nullable_int=nullable_int)
+
+    # Reformat time variables to pandas timestamps. Columns without a declared
+    # format are coerced as they are (so integer years stay integers for
+    # to_datetime rather than being read as dates by read_csv)
+    if time_formats is None:
+        time_formats = {}
+    n_failed = {}
     for col in time_var:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
+        if col in time_formats:
+            values = df[col]
+            df[col] = parse_time(values, time_formats[col])
+            n_failed[col] = int((values.notnull() & df[col].isnull()).sum())
+        elif not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df, n_failed
+
+
+def parse_time(values, time_format):
+    """
+    Convert strings in known date formats to pandas timestamps.
+
+    Each distinct value is only parsed once, with an exact format rather than
+    by guessing the format of each value. Values that don't match any of the
+    formats become NaT.
+
+    Parameters
+    ----------
+    values : Series
+        dates as strings (e.g. '2016-03-25')
+
+    time_format : string or list
+        format (e.g. '%Y-%m-%d') or list of formats to try in order
+        (e.g. ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S'])
+
+    Returns
+    ----------
+    Series of timestamps with the same index as values
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if isinstance(time_format, str):
+        time_format = [time_format]
+
+    # codes index the distinct values, -1 for missing values
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques).astype(str)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    for fmt in time_format:
+        unparsed = parsed.isnull()
+        if not unparsed.any():
+            break
+        parsed[unparsed] = pd.to_datetime(uniques[unparsed], format=fmt,
+                                          errors='coerce')
+
+    # Append a NaT for the missing values to pick
+    parsed = np.append(parsed.values, np.datetime64('NaT', 'ns'))
+    return pd.Series(parsed[codes], index=values.index, name=values.name)
+
+
+def _time_formats(time_var, time_format):
+    """
+    Make a dict of the date formats (as lists) of the time_var columns from
+    a time_format given as a string, list or dict.
+    """
+    if time_format is None:
+        return {}
+    if isinstance(time_format, dict):
+        return {col: ([fmt] if isinstance(fmt, str) else list(fmt))
+                for col, fmt in time_format.items()}
+    if isinstance(time_format, str):
+        time_format = [time_format]
+    return {col: list(time_format) for col in time_var}
+
+
+def _warn_time_failures(n_failed):
+    """Warn about time values that didn't match the declared formats."""
+    for col, n in n_failed.items():
+        if n > 0:
+            warnings.warn('%d values of %s did not match the date format '
+                          'and were set to NaT' % (n, col))
+
+
+def _read_folder_csv(path, fname, encoding=None, source_column=None,
+                     dtype=None, columns_to_drop=None):
+    """
+    Read the csv file of a single folder, optionally recording the folder.
+
+    dtype and columns_to_drop refer to column names without the
+    zero width no-break space that some headers start with, and may include
+    columns that are not in the file. Columns in columns_to_drop are never
+    parsed.
+    """
+    read_kwargs = _csv_read_kwargs(fname, encoding=encoding, dtype=dtype,
+                                   columns_to_drop=columns_to_drop)
+    df = pd.read_csv(fname, low_memory=False, encoding=encoding,
+                     **read_kwargs)
+    if source_column is not None:
+        df[source_column] = path
     return df
 
-read_table.__doc__ = read_table.__doc__ % file_path_boilerplate
+
+def _csv_read_kwargs(fname, encoding=None, dtype=None, columns_to_drop=None):
+    """
+    Translate column names into read_csv keyword arguments (usecols & dtype)
+    that use the raw header names of a file.
+    """
+    read_kwargs = {}
+    if dtype or columns_to_drop:
+        header = pd.read_csv(fname, nrows=0, encoding=encoding).columns
+        raw_names = {col.lstrip('\ufeff'): col for col in header}
+        if columns_to_drop:
+            columns_to_drop = set(columns_to_drop)
+            read_kwargs['usecols'] = [raw_names[col] for col in raw_names
+                                      if col not in columns_to_drop]
+        if dtype:
+            read_kwargs['dtype'] = {raw_names[col]: col_dtype
+                                    for col, col_dtype in dtype.items()
+                                    if col in raw_names}
+    return read_kwargs
+
+
+def stream_table(file_spec, out_file, county=None, data_dir=None, paths=None,
+                 columns_to_drop=None, categorical_var=None,
+                 categorical_unknown=CATEGORICAL_UNKNOWN, time_var=None,
+                 duplicate_check_columns=None, dedup=True, encoding=None,
+                 name_columns=None, source_column=None, dtype=None,
+                 nullable_int=False, time_format=None, chunksize=100000):
+    """
+    Read in a .csv table from multiple folders in chunks and write the
+    cleaned table to a Parquet file, for tables that don't fit in memory.
+
+    This applies the same clean-up as read_table (column drops, duplicates,
+    unknown categorical codes, timestamps), but only ever holds one chunk of
+    rows in memory. Deduplication keeps the last of the rows with the same
+    duplicate_check_columns values, using a first pass that spills the
+    values of these columns to temporary files next to out_file, split by
+    their hash so that each file can be deduplicated on its own. The row
+    index is not kept. Requires pyarrow.
+
+    Numbers in the duplicate_check_columns are compared as numbers in every
+    chunk. read_table compares them as text in files where the column also
+    has text values, so rows like '1' and '1.0' can be duplicates here but
+    not in read_table.
+
+    Parameters
+    ----------
+    %s
+
+    out_file : string
+        full path of the Parquet file to write
+
+    chunksize : int
+        number of csv rows to read at a time. Default is 100000.
+
+    The other parameters are the same as for read_table. Columns without a
+    declared dtype are written as float64 if they are numeric in some chunks
+    and as strings if they have strings in any chunk.
+
+    Returns
+    ----------
+    out_file
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if columns_to_drop is None:
+        columns_to_drop = []
+    if categorical_var is None:
+        categorical_var = []
+    if time_var is None:
+        time_var = []
+    if dtype is None:
+        dtype = {}
+    time_formats = _time_formats(time_var, time_format)
+
+    file_spec = _resolve_file_spec(file_spec, county=county, data_dir=data_dir,
+                                   paths=paths)
+    file_spec_use = file_spec.copy()
+    # Same order as read_table: the first file, then the rest of the files
+    folder_items = [file_spec_use.popitem()] + list(file_spec_use.items())
+
+    read_dtype = dict({col: str for col in time_formats}, **dtype)
+    out_dir = op.dirname(op.abspath(out_file))
+    with tempfile.TemporaryDirectory(dir=out_dir) as work_dir:
+        drop_rows = None
+        if dedup:
+            if duplicate_check_columns is None:
+                warnings.warn('dedup is True but duplicate_check_columns is ' +
+                              'None, no deduplication')
+            else:
+                drop_rows = [np.load(drop_file, mmap_mode='r')
+                             for drop_file in _duplicate_rows(
+                                 folder_items, duplicate_check_columns,
+                                 work_dir, encoding=encoding,
+                                 dtype=read_dtype, chunksize=chunksize)]
+                cursors = [0] * len(drop_rows)
+
+        # Clean the chunks and write them as separate parts, so that each
+        # part can have its own column types
+        part_files = []
+        column_types = {}
+        n_failed = dict.fromkeys(time_formats, 0)
+        row_offset = 0
+        for path, fname in folder_items:
+            read_kwargs = _csv_read_kwargs(fname, encoding=encoding,
+                                           dtype=read_dtype,
+                                           columns_to_drop=columns_to_drop)
+            for chunk in pd.read_csv(fname, encoding=encoding,
+                                     chunksize=chunksize, **read_kwargs):
+                n_rows = chunk.shape[0]
+                if drop_rows is not None:
+                    chunk = chunk[_keep_mask(drop_rows, cursors, row_offset,
+                                             n_rows)]
+                row_offset += n_rows
+
+                chunk = _strip_bom(chunk)
+                chunk = chunk.drop(list(set(columns_to_drop).intersection(
+                    set(chunk.columns))), axis=1)
+                chunk, chunk_failed = _clean_columns(
+                    chunk, categorical_var, categorical_unknown, time_var,
+                    time_formats=time_formats, nullable_int=nullable_int)
+                for col, n in chunk_failed.items():
+                    n_failed[col] += n
+                if source_column is not None:
+                    chunk[source_column] = path
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                for field in table.schema:
+                    column_types.setdefault(field.name, []).append(field.type)
+                part_files.append(op.join(work_dir,
+                                          '%d.parquet' % len(part_files)))
+                pq.write_table(table, part_files[-1])
+        # Release the memory mapped files before the directory is removed
+        drop_rows = None
+
+        # Then combine the parts into one file with consistent types
+        schema = pa.schema([(name, _unify_types(types))
+                            for name, types in column_types.items()])
+        with pq.ParquetWriter(out_file, schema) as writer:
+            for part_file in part_files:
+                table = pq.read_table(part_file)
+                columns = []
+                for field in schema:
+                    if field.name in table.column_names:
+                        columns.append(table.column(field.name).cast(
+                            field.type))
+                    else:
+                        columns.append(pa.nulls(table.num_rows, field.type))
+                writer.write_table(pa.Table.from_arrays(columns,
+                                                        schema=schema))
+
+    _warn_time_failures(n_failed)
+    return out_file
+
+stream_table.__doc__ = stream_table.__doc__ % file_path_boilerplate
+
+
+def _duplicate_rows(folder_items, duplicate_check_columns, work_dir,
+                    encoding=None, dtype=None, chunksize=100000,
+                    bucket_bytes=2 ** 26):
+    """
+    Find the rows that deduplication drops (all but the last occurrence of
+    the duplicate_check_columns values) without holding the tables in memory.
+
+    The key values of each chunk are appended to one of several bucket files
+    in work_dir, picked by their hash, so that equal keys always end up in
+    the same bucket. Each bucket is then deduplicated on its own by comparing
+    the key values themselves, so a hash collision can't drop a row.
+
+    Parameters
+    ----------
+    folder_items : list
+        list of (path, filename) tuples, in the order the files are read
+
+    duplicate_check_columns : list
+        list of columns to consider in deduplication
+
+    work_dir : string
+        directory for the bucket files
+
+    dtype : dict
+        dtypes the columns are read with, as in read_table
+
+    bucket_bytes : int
+        number of csv bytes per bucket, which bounds the size of the
+        buckets. Default is 64 MB.
+
+    Returns
+    ----------
+    list of .npy files, one per bucket, with the sorted numbers (counting
+    the rows of all files in order) of the rows to drop
+    """
+    if dtype is None:
+        dtype = {}
+    # Columns declared as text are compared as text, others as numbers
+    text_columns = [col for col in duplicate_check_columns if col in dtype and
+                    not pd.api.types.is_numeric_dtype(
+                        pd.api.types.pandas_dtype(dtype[col]))]
+
+    total_bytes = sum(op.getsize(fname) for _, fname in folder_items)
+    n_buckets = max(1, int(np.ceil(total_bytes / bucket_bytes)))
+    bucket_files = [op.join(work_dir, 'bucket%d.csv' % i)
+                    for i in range(n_buckets)]
+
+    row_offset = 0
+    for path, fname in folder_items:
+        header = pd.read_csv(fname, nrows=0, encoding=encoding).columns
+        raw_names = {col.lstrip('\ufeff'): col for col in header}
+        # At least one column is needed to count the rows
+        usecols = [raw_names[col] for col in duplicate_check_columns
+                   if col in raw_names] or [header[0]]
+        key_dtype = {raw_names[col]: dtype[col] for col in dtype
+                     if col in raw_names}
+        for chunk in pd.read_csv(fname, encoding=encoding, usecols=usecols,
+                                 dtype=key_dtype, chunksize=chunksize):
+            chunk = _strip_bom(chunk)
+            keys = pd.DataFrame({
+                'row': np.arange(row_offset, row_offset + chunk.shape[0]),
+                'key': _dedup_keys(chunk, duplicate_check_columns,
+                                   text_columns).values})
+            row_offset += chunk.shape[0]
+            bucket = (pd.util.hash_pandas_object(keys['key'], index=False)
+                      .values % n_buckets)
+            for i, rows in keys.groupby(bucket):
+                rows.to_csv(bucket_files[i], mode='a', header=False,
+                            index=False)
+
+    drop_files = []
+    for i, bucket_file in enumerate(bucket_files):
+        drop = np.array([], dtype=np.int64)
+        if op.exists(bucket_file):
+            rows = pd.read_csv(bucket_file, names=['row', 'key'],
+                               dtype={'row': np.int64, 'key': str},
+                               keep_default_na=False)
+            drop = np.sort(rows['row'].values[
+                rows.duplicated('key', keep='last').values])
+            os.remove(bucket_file)
+        drop_files.append(op.join(work_dir, 'drop%d.npy' % i))
+        np.save(drop_files[-1], drop)
+    return drop_files
+
+
+def _dedup_keys(df, duplicate_check_columns, text_columns):
+    """
+    Combine the duplicate_check_columns of each row into a string that is the
+    same for rows read_table would consider duplicates. Values of columns not
+    in text_columns that are numbers are compared as floats, so that e.g.
+    1 and '1.0' are the same value whatever dtype the chunk was read with.
+    Missing columns count as missing values.
+    """
+    parts = []
+    for col in duplicate_check_columns:
+        if col not in df.columns:
+            parts.append(pd.Series('n', index=df.index))
+            continue
+        values = df[col].astype(object)
+        text = 's' + values.astype(str)
+        if col not in text_columns:
+            numbers = pd.to_numeric(values, errors='coerce')
+            is_number = numbers.notnull()
+            numbers = numbers[is_number].astype(float)
+            text[is_number] = 'f' + numbers.astype(str)
+        text[values.isnull()] = 'n'
+        parts.append(text)
+    return parts[0].str.cat(parts[1:], sep='\x1f')
+
+
+def _keep_mask(drop_rows, cursors, row_offset, n_rows):
+    """
+    Make the boolean mask of the rows to keep among the n_rows rows starting
+    at row_offset, from the sorted arrays of rows to drop of each bucket.
+    cursors holds the position reached in each array and is advanced.
+    """
+    keep = np.ones(n_rows, dtype=bool)
+    for i, rows in enumerate(drop_rows):
+        end = cursors[i] + np.searchsorted(rows[cursors[i]:],
+                                           row_offset + n_rows)
+        keep[rows[cursors[i]:end] - row_offset] = False
+        cursors[i] = end
+    return keep
+
+
+def _unify_types(types):
+    """Find a pyarrow type that all the types of a column can be cast to."""
+    import pyarrow as pa
+
+    types = [t for t in types if not pa.types.is_null(t)]
+    if len(types) == 0:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) or
+           pa.types.is_boolean(t) for t in types):
+        return pa.float64()
+    if all(pa.types.is_timestamp(t) for t in types):
+        return pa.timestamp('ns')
+    if all(pa.types.is_dictionary(t) for t in types):
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
 
 
 def split_rows_to_columns(df, category_column, category_suffix, merge_columns):
@@ -259,37 +832,81 @@ def split_rows_to_columns(df, category_column, category_suffix, merge_columns):
 
     Returns
     ----------
-    new dataframe with response columns split into *_entry and *_exit columns
+    new dataframe with response columns split into *_entry and *_exit columns.
+        Repeated rows for the same merge values and category are paired up
+        in order of appearance.
     """
-    columns_to_rename = list(df.columns.values)
-    if isinstance(merge_columns, list):
-        for col in merge_columns:
-            columns_to_rename.remove(col)
-    else:
-        columns_to_rename.remove(merge_columns)
-
     if isinstance(category_column, (list, tuple)):
         e_s = "The type column (e.g. 'CollectionStage') needs to be defined as"
         e_s += "a single string in the relevant metadata file. Cannot be a "
         e_s += "container!"
         raise TypeError(e_s)
 
-    columns_to_rename.remove(category_column)
-
-    # group by each type in turn
-    gb = df.groupby(category_column)
-    for index, tpl in enumerate(gb):
-        name, group = tpl
-        rename_dict = dict(zip(
-            columns_to_rename,
-            [s + category_suffix[name] for s in columns_to_rename]))
-        this_df = group.rename(columns=rename_dict).drop(category_column,
-                                                         axis=1)
-        if index == 0:
-            df_wide = this_df
-        else:
-            df_wide = pd.merge(df_wide, this_df, how='outer',
-                               left_on=merge_columns, right_on=merge_columns)
+    if not isinstance(merge_columns, list):
+        merge_columns = [merge_columns]
+
+    value_columns = [col for col in df.columns.values
+                     if col not in merge_columns + [category_column]]
+
+    # rows without a category can't be assigned to a column
+    df = df[df[category_column].notnull()]
+
+    # Several rows with the same merge values and category are lined up by
+    # their order of appearance, so each gets its own row in the wide table
+    gb = df.groupby(merge_columns + [category_column], sort=False,
+                    dropna=False)
+    occurrence = gb.cumcount().values
+    n_category = gb[category_column].transform('size').values
+
+    # When a category has fewer rows than another for the same merge values,
+    # repeat its first row to fill the gap (as a merge would pair it up)
+    n_merge = pd.Series(n_category, index=df.index).groupby(
+        [df[col] for col in merge_columns], sort=False,
+        dropna=False).transform('max').values
+    n_pad = np.where(occurrence == 0, n_merge - n_category, 0)
+    if n_pad.any():
+        pad_rows = np.repeat(np.arange(df.shape[0]), n_pad)
+        pad_start = np.repeat(np.cumsum(n_pad) - n_pad, n_pad)
+        pad_occurrence = (n_category[pad_rows] +
+                          np.arange(pad_rows.shape[0]) - pad_start)
+        df = pd.concat([df, df.iloc[pad_rows]])
+        occurrence = np.concatenate([occurrence, pad_occurrence])
+
+    df_long = df.set_index(merge_columns +
+                           [pd.Series(occurrence, index=df.index,
+                                      name='_occurrence'),
+                            category_column])
+    df_wide = df_long[value_columns].unstack(category_column)
+
+    # unstack upcasts columns when any row misses a category; restore the
+    # original dtypes for categories that are present in every row
+    present = pd.Series(True, index=df_long.index).unstack(category_column,
+                                                           fill_value=False)
+    categories = sorted(df[category_column].unique())
+    for cat in categories:
+        if present[cat].all():
+            for col in value_columns:
+                df_wide[(col, cat)] = df_wide[(col, cat)].astype(df[col].dtype)
+
+    # order the columns by category, then name them as *col* + *suffix*
+    df_wide = df_wide[[(col, cat) for cat in categories
+                       for col in value_columns]]
+    df_wide.columns = [col + category_suffix[cat]
+                       for col, cat in df_wide.columns]
+
+    df_wide = df_wide.reset_index(level='_occurrence', drop=True)
+    df_wide = df_wide.reset_index()
+
+    # keep the column order of merging one table per category: the columns
+    # of the first category, with the merge columns in their original
+    # places, then the value columns of each other category
+    if categories:
+        first_suffix = category_suffix[categories[0]]
+        df_wide = df_wide[
+            [col if col in merge_columns else col + first_suffix
+             for col in df.columns if col != category_column] +
+            [col + category_suffix[cat] for cat in categories[1:]
+             for col in value_columns]]
     return df_wide
 
 
@@ -318,6 +935,34 @@ def read_entry_exit_table(metadata, county=None, file_spec=None, data_dir=None,
     separate entry & exit values are combined with different columns for
     entry & exit
     """
+    df, extra_metadata = _read_stage_rows(metadata, county=county,
+                                          file_spec=file_spec,
+                                          data_dir=data_dir, paths=paths)
+
+    stage_suffixes = dict(zip([extra_metadata['entry_stage_val'],
+                               extra_metadata['exit_stage_val']], suffixes))
+    df_wide = split_rows_to_columns(df,
+                                    extra_metadata['collection_stage_column'],
+                                    stage_suffixes,
+                                    extra_metadata['person_enrollment_ID'])
+
+    return df_wide
+
+read_entry_exit_table.__doc__ = read_entry_exit_table.__doc__ % (
+        file_path_boilerplate)
+
+
+def _read_stage_rows(metadata, county=None, file_spec=None, data_dir=None,
+                     paths=None):
+    """
+    Read in a table with a collection stage column and keep only the rows
+    for the entry & exit stages.
+
+    Returns
+    ----------
+    tuple of (dataframe, dict): the rows at entry & exit, and the collection
+        stage metadata (which is popped from metadata)
+    """
     if not isinstance(metadata, dict):
         metadata = get_metadata_dict(metadata)
     extra_metadata = {'collection_stage_column': None,
@@ -343,23 +988,17 @@ def read_entry_exit_table(metadata, county=None, file_spec=None, data_dir=None,
             (df[extra_metadata['collection_stage_column']] != extra_metadata['annual_assessment_stage_val']) &
             (df[extra_metadata['collection_stage_column']] != extra_metadata['post_exit_stage_val'])]
 
-    df_wide = split_rows_to_columns(df, extra_metadata['collection_stage_column'],
-                                    dict(zip([extra_metadata['entry_stage_val'],
-                                              extra_metadata['exit_stage_val']], suffixes)),
-                                    extra_metadata['person_enrollment_ID'])
-
-    return df_wide
-
-read_entry_exit_table.__doc__ = read_entry_exit_table.__doc__ % (
-        file_path_boilerplate)
+    return df, extra_metadata
 
 
 def get_metadata_dict(metadata_file):
-    """Little function to read a JSON metadata file into a dict."""
-    metadata_handle = open(metadata_file)
-    metadata = json.loads(metadata_handle.read())
-    _ = metadata.pop('name')
-    return metadata
+    """
+    Little function to read a JSON metadata file into a dict.
+
+    The file is parsed once (see puget.metadata.get_schema) and each call
+    returns a new dict, without the name, that the caller may modify.
+    """
+    return pm.get_schema(metadata_file).to_dict()
 
 
 def get_enrollment(county=None, groups=True, file_spec=None, data_dir=None,
@@ -385,7 +1024,7 @@ def get_enrollment(county=None, groups=True, file_spec=None, data_dir=None,
         enrollment, optionally with people who are not in groups removed
     """
     if file_spec is None:
-        file_spec = 'Enrollment.csv'
+        file_spec = TABLE_FILES['enrollment']
 
     metadata = get_metadata_dict(metadata_file)
     groupID_column = metadata.pop('groupID_column')
@@ -431,7 +1070,7 @@ def get_exit(county=None, file_spec=None, data_dir=None, paths=None,
     dataframe with rows representing exit record of a person per enrollment
     """
     if file_spec is None:
-        file_spec = 'Exit.csv'
+        file_spec = TABLE_FILES['exit']
 
     metadata = get_metadata_dict(metadata_file)
     df_destination_column = metadata.pop('destination_column')
@@ -465,7 +1104,7 @@ def get_client(county=None, file_spec=None, data_dir=None, paths=None,
     dataframe with rows representing demographic information of a person
     """
     if file_spec is None:
-        file_spec = 'Client.csv'
+        file_spec = TABLE_FILES['client']
 
     metadata = get_metadata_dict(metadata_file)
     # Don't want to deduplicate before checking if DOB is sane because the last
@@ -500,61 +1139,25 @@ def get_client(county=None, file_spec=None, data_dir=None, paths=None,
                     duplicate_check_columns=mid_dedup_cols, **metadata)
     df = df.set_index(np.arange(df.shape[0]))
 
-    # iterate through people with more than one entry and resolve differences.
+    # resolve differences between rows of people with more than one entry.
     # Set all rows to the same sensible value
     gb = df.groupby(pid_column)
-    n_entries = gb.size()
-    for pid, group in gb:
-        # turn off SettingWithCopy warning for this object
-        group.is_copy = False
-
-        if n_entries.loc[pid] > 1:
-            # for differences in time columns, if the difference is less than
-            # a year then take the midpoint, otherwise set to NaN
-            for col in metadata['time_var']:
-                if col == dob_column:
-                    continue
-                if len(np.unique(group[col])) > 1:
-                    is_valid = ~pd.isnull(group[col])
-                    n_valid = np.sum(is_valid)
-                    if n_valid == 1:
-                        group[col] = group[col][is_valid].values[0]
-                    elif n_valid > 1:
-                        t_diff = np.max(group[col]) - np.min(group[col])
-                        if t_diff < datetime.timedelta(365):
-                            t_diff_sec = t_diff.seconds + 86400 * t_diff.days
-                            new_date = (np.min(group[col]) +
-                                        datetime.timedelta(
-                                            seconds=t_diff_sec / 2.)).date()
-                            group[col] = pd.datetime(new_date.year,
-                                                     new_date.month,
-                                                     new_date.day)
-                        else:
-                            group[col] = pd.NaT
-
-            # for differences in boolean columns, if ever true then set to true
-            for col in boolean_cols:
-                if len(np.unique(group[col])) > 1:
-                    is_valid = ~pd.isnull(group[col])
-                    n_valid = np.sum(is_valid)
-                    if n_valid == 1:
-                        group[col] = group[col][is_valid].values[0]
-                    elif n_valid > 1:
-                        group[col] = np.max(group[col][is_valid])
-
-            # for differences in numeric type columns, if there are conflicting
-            # valid answers, set to NaN
-            for col in numeric_cols:
-                if len(np.unique(group[col])) > 1:
-                    is_valid = ~pd.isnull(group[col])
-                    n_valid = np.sum(is_valid)
-                    if n_valid == 1:
-                        group[col] = group[col][is_valid].values[0]
-                    elif n_valid > 1:
-                        group[col] = np.nan
-
-            # push these changes back into the dataframe
-            df.iloc[np.where(df[pid_column] == pid)[0]] = group
+
+    # for differences in time columns, if the difference is less than
+    # a year then take the midpoint, otherwise set to NaN
+    for col in metadata['time_var']:
+        if col == dob_column:
+            continue
+        df[col] = _resolve_time_conflicts(gb[col])
+
+    # for differences in boolean columns, if ever true then set to true
+    for col in boolean_cols:
+        df[col] = _resolve_boolean_conflicts(gb[col])
+
+    # for differences in numeric type columns, if there are conflicting
+    # valid answers, set to NaN
+    for col in numeric_cols:
+        df[col] = _resolve_numeric_conflicts(gb[col])
 
     # Now all rows with the same pid_column have identical time_var,
     # boolean & numeric_col values so we can perform full deduplication
@@ -567,12 +1170,7 @@ def get_client(county=None, file_spec=None, data_dir=None, paths=None,
 
     if name_exclusion:
         name_cols = metadata.pop('name_columns')
-        df['exclude_by_name'] = df.apply(_name_exclude,
-                                        args=[name_cols, NAME_EXCLUSION],
-                                        axis=1)
-        # The function returns True for keepers:
-        df = df[df["exclude_by_name"]]
-        df.drop(['exclude_by_name'], axis=1, inplace=True)
+        df = df[_keep_by_name(df, name_cols, NAME_EXCLUSION)]
 
     return df
 
@@ -580,6 +1178,105 @@ get_client.__doc__ = get_client.__doc__ % (file_path_boilerplate,
                                            metdata_boilerplate)
 
 
+def _conflict_masks(grouped):
+    """
+    Find the rows of groups that have more than one distinct value.
+
+    Parameters
+    ----------
+    grouped : SeriesGroupBy
+        A single column grouped by the ID column (e.g. PersonalID)
+
+    Returns
+    ----------
+    tuple of (varies, n_valid): a boolean Series that is True for rows in
+        groups with more than one distinct value (NaN counts as a value) and
+        an integer Series with the number of non-null values in the group of
+        each row. Both are aligned with the original column.
+    """
+    varies = grouped.transform('nunique', dropna=False) > 1
+    n_valid = grouped.transform('count')
+    return varies, n_valid
+
+
+def _resolve_time_conflicts(grouped):
+    """
+    Resolve differences in a time column between rows of the same group.
+
+    If only one row of a group has a valid time, all rows get that time. If
+    several rows have valid times that are less than a year apart, all rows
+    get the midpoint (truncated to the day), otherwise they are set to NaT.
+
+    Parameters
+    ----------
+    grouped : SeriesGroupBy
+        A single time column grouped by the ID column
+
+    Returns
+    ----------
+    Series with the resolved values, aligned with the original column
+    """
+    col = grouped.obj
+    varies, n_valid = _conflict_masks(grouped)
+    t_min = grouped.transform('min')
+    t_diff = grouped.transform('max') - t_min
+    midpoint = (t_min + t_diff.dt.floor('s') / 2).dt.floor('D')
+
+    resolved = col.where(~(varies & (n_valid == 1)), grouped.transform('max'))
+    multi_valid = varies & (n_valid > 1)
+    resolved = resolved.where(~(multi_valid &
+                                (t_diff < datetime.timedelta(365))),
+                              midpoint)
+    resolved = resolved.where(~(multi_valid &
+                                (t_diff >= datetime.timedelta(365))),
+                              pd.NaT)
+    return resolved
+
+
+def _resolve_boolean_conflicts(grouped):
+    """
+    Resolve differences in a boolean column between rows of the same group.
+
+    If the value is ever true (or only one row is valid), all rows of the
+    group get the maximum valid value.
+
+    Parameters
+    ----------
+    grouped : SeriesGroupBy
+        A single boolean column grouped by the ID column
+
+    Returns
+    ----------
+    Series with the resolved values, aligned with the original column
+    """
+    col = grouped.obj
+    varies, n_valid = _conflict_masks(grouped)
+    return col.where(~(varies & (n_valid > 0)), grouped.transform('max'))
+
+
+def _resolve_numeric_conflicts(grouped):
+    """
+    Resolve differences in a numeric code column between rows of the same
+    group.
+
+    If only one row of a group has a valid value, all rows get that value. If
+    there are conflicting valid answers, all rows are set to NaN.
+
+    Parameters
+    ----------
+    grouped : SeriesGroupBy
+        A single numeric code column grouped by the ID column
+
+    Returns
+    ----------
+    Series with the resolved values, aligned with the original column
+    """
+    col = grouped.obj
+    varies, n_valid = _conflict_masks(grouped)
+    resolved = col.where(~(varies & (n_valid == 1)), grouped.transform('max'))
+    return resolved.where(~(varies & (n_valid > 1)), np.nan)
+
+
 def get_disabilities(county=None, file_spec=None,  data_dir=None, paths=None,
                      metadata_file=METADATA_FILES['disabilities'],
                      disability_type_file=op.join(DATA_PATH, 'metadata',
@@ -605,7 +1302,7 @@ def get_disabilities(county=None, file_spec=None,  data_dir=None, paths=None,
         exit of a person per enrollment
     """
     if file_spec is None:
-        file_spec = 'Disabilities.csv'
+        file_spec = TABLE_FILES['disabilities']
 
     metadata = get_metadata_dict(metadata_file)
     extra_metadata = {'type_column': None,
@@ -620,33 +1317,45 @@ def get_disabilities(county=None, file_spec=None,  data_dir=None, paths=None,
     extra_metadata['person_enrollment_ID'] = metadata['person_enrollment_ID']
 
     stage_suffixes = ENTRY_EXIT_SUFFIX
-    df_stage = read_entry_exit_table(metadata, county=county,
-                                     file_spec=file_spec, data_dir=data_dir,
-                                     paths=paths, suffixes=stage_suffixes)
+    df, stage_metadata = _read_stage_rows(metadata, county=county,
+                                          file_spec=file_spec,
+                                          data_dir=data_dir, paths=paths)
 
     mapping_dict = get_metadata_dict(disability_type_file)
     # convert to integer keys
     mapping_dict = {int(k): v for k, v in mapping_dict.items()}
 
     type_suffixes = ['_' + s for s in mapping_dict.values()]
-    merge_columns = [extra_metadata['person_enrollment_ID'],
-                     extra_metadata['type_column'] + stage_suffixes[1],
-                     extra_metadata['response_column'] + stage_suffixes[1]]
-
-    df_type1 = split_rows_to_columns(df_stage, (extra_metadata['type_column'] +
-                                                stage_suffixes[0]),
-                                     dict(zip(list(mapping_dict.keys()),
-                                          type_suffixes)), merge_columns)
-
-    merge_columns = [extra_metadata['person_enrollment_ID']]
-    for ts in type_suffixes:
-        col = extra_metadata['response_column'] + stage_suffixes[0] + ts
-        if col in list(df_type1.columns.values):
-            merge_columns.append(col)
-    df_wide = split_rows_to_columns(df_type1, (extra_metadata['type_column'] +
-                                    stage_suffixes[1]),
-                                    dict(zip(list(mapping_dict.keys()),
-                                             type_suffixes)), merge_columns)
+    stage_suffix_dict = dict(zip([stage_metadata['entry_stage_val'],
+                                  stage_metadata['exit_stage_val']],
+                                 stage_suffixes))
+    type_suffix_dict = dict(zip(list(mapping_dict.keys()), type_suffixes))
+
+    # Combine stage & type into a single category, so that both are split
+    # into columns (e.g. response_entry_Physical) in one pass
+    stage_column = stage_metadata['collection_stage_column']
+    type_column = extra_metadata['type_column']
+    df = df.assign(stage_type=(df[stage_column].map(stage_suffix_dict) +
+                               df[type_column].map(type_suffix_dict)))
+    df = df.drop([stage_column, type_column], axis=1)
+    category_suffix = {s: s for s in df['stage_type'].dropna().unique()}
+    df_wide = split_rows_to_columns(df, 'stage_type', category_suffix,
+                                    extra_metadata['person_enrollment_ID'])
+
+    # keep the column order of splitting by entry type, then by exit type:
+    # the first entry & exit types, then the other entry types, then the
+    # other exit types (types in the order of their codes)
+    stage_type_columns = [
+        [extra_metadata['response_column'] + ss + type_suffix_dict[k]
+         for k in sorted(type_suffix_dict)
+         if (extra_metadata['response_column'] + ss + type_suffix_dict[k]
+             in df_wide.columns)]
+        for ss in stage_suffixes[:2]]
+    entry_columns, exit_columns = stage_type_columns
+    df_wide = df_wide[[col for col in df_wide.columns
+                       if col not in entry_columns + exit_columns] +
+                      entry_columns[:1] + exit_columns[:1] +
+                      entry_columns[1:] + exit_columns[1:]]
 
     response_cols = []
     new_cols = []
@@ -683,7 +1392,7 @@ def get_employment_education(county=None, file_spec=None, data_dir=None, paths=N
               of a person per enrollment
     """
     if file_spec is None:
-        file_spec = 'EmploymentEducation.csv'
+        file_spec = TABLE_FILES['employment_education']
 
     df_wide = read_entry_exit_table(metadata_file, county=county,
                                     file_spec=file_spec, data_dir=data_dir,
@@ -712,7 +1421,7 @@ def get_health_dv(county=None, file_spec=None, data_dir=None, paths=None,
               of a person per enrollment
     """
     if file_spec is None:
-        file_spec = 'HealthAndDV.csv'
+        file_spec = TABLE_FILES['health_dv']
 
     df_wide = read_entry_exit_table(metadata_file, county=county,
                                     file_spec=file_spec, data_dir=data_dir,
@@ -741,7 +1450,7 @@ def get_income(county=None, file_spec=None, data_dir=None, paths=None,
         enrollment
     """
     if file_spec is None:
-        file_spec = 'IncomeBenefits.csv'
+        file_spec = TABLE_FILES['income']
 
     metadata = get_metadata_dict(metadata_file)
     if 'columns_to_take_max' in metadata:
@@ -770,18 +1479,11 @@ def get_income(county=None, file_spec=None, data_dir=None, paths=None,
                           ' is not in maximize_cols so only the first value' +
                           ' per projectID per entry or exit will be kept')
 
-    gb = df_wide.groupby(person_enrollment_ID)
-    for index, tpl in enumerate(gb):
-        name, group = tpl
-        if len(group) == 1:
-            continue
-
-        update_dict = {}
-        for col in maximize_cols:
-            if col in group.columns:
-                max_val = group[col].max()
-                row_index = df_wide[df_wide[person_enrollment_ID] == name].index.tolist()
-                df_wide.set_value(row_index[0], col, max_val)
+    # Put the per-enrollment maximum of each maximize column into every row,
+    # so that the first row kept by deduplication carries it
+    maximize_cols = [col for col in maximize_cols if col in df_wide.columns]
+    df_wide[maximize_cols] = df_wide.groupby(person_enrollment_ID)[
+        maximize_cols].transform('max')
 
     df_wide = df_wide.drop_duplicates([person_enrollment_ID])
     return df_wide
@@ -808,7 +1510,7 @@ def get_project(county=None, file_spec=None, data_dir=None, paths=None,
     dataframe with rows representing exit record of a person per enrollment
     """
     if file_spec is None:
-        file_spec = 'Project.csv'
+        file_spec = TABLE_FILES['project']
 
     metadata = get_metadata_dict(metadata_file)
     project_type_column = metadata.pop('project_type_column')
@@ -841,13 +1543,106 @@ get_project.__doc__ = get_project.__doc__ % (file_path_boilerplate,
                                              metdata_boilerplate)
 
 
+# dict of the functions that read in & clean each table type
+TABLE_GETTERS = {'enrollment': get_enrollment,
+                 'exit': get_exit,
+                 'client': get_client,
+                 'disabilities': get_disabilities,
+                 'employment_education': get_employment_education,
+                 'health_dv': get_health_dv,
+                 'income': get_income,
+                 'project': get_project}
+
+# Metadata field of the column that all the cleaning of each table is grouped
+# by (deduplication, conflict resolution, ...), so that rows with different
+# values in this column can be cleaned independently
+TABLE_KEYS = {'enrollment': 'groupID_column',
+              'exit': 'person_enrollment_ID',
+              'client': 'person_ID',
+              'disabilities': 'person_enrollment_ID',
+              'employment_education': 'person_enrollment_ID',
+              'health_dv': 'person_enrollment_ID',
+              'income': 'person_enrollment_ID',
+              'project': 'program_ID'}
+
+
+def get_table(table, cache_dir=None, **kwargs):
+    """
+    Read in and clean a table with its get_* function, optionally through an
+    on-disk cache.
+
+    Parameters
+    ----------
+    table : string
+        table type, must be a key in TABLE_GETTERS (e.g. 'client')
+
+    cache_dir : string
+        If provided, directory of the cache. The cleaned table is stored there
+        in Parquet format and reloaded on later calls, as long as the raw
+        data files (size & modification time), the metadata files (contents)
+        and the arguments are unchanged. Default is None (no caching).
+
+    kwargs :
+        passed to the get_* function for the table
+
+    Returns
+    ----------
+    dataframe returned by the get_* function
+    """
+    func = TABLE_GETTERS[table]
+    if cache_dir is None:
+        return func(**kwargs)
+
+    key = pc.cache_key(_table_cache_inputs(table, func, kwargs))
+    fname = pc.cache_path(cache_dir, table, key)
+    df = pc.read_cached(fname)
+    if df is None:
+        df = func(**kwargs)
+        pc.write_cached(df, fname)
+    return df
+
+
+def _table_cache_inputs(table, func, kwargs):
+    """Collect everything that determines the output of a get_* call."""
+    arguments = inspect.signature(func).bind(**kwargs)
+    arguments.apply_defaults()
+    arguments = arguments.arguments
+
+    file_spec = arguments['file_spec']
+    if file_spec is None:
+        file_spec = TABLE_FILES[table]
+    file_spec = _resolve_file_spec(file_spec, county=arguments['county'],
+                                   data_dir=arguments['data_dir'],
+                                   paths=arguments['paths'])
+    data_files = {str(path): [op.abspath(fname), pc.file_fingerprint(fname)]
+                  for path, fname in file_spec.items()}
+
+    # metadata passed as arguments (e.g. metadata_file) and the packaged
+    # metadata used internally (e.g. destination_mappings.csv)
+    metadata_files = [v for v in arguments.values()
+                      if isinstance(v, str) and op.isfile(v)]
+    metadata_dir = op.join(DATA_PATH, 'metadata')
+    metadata_files += [op.join(metadata_dir, f)
+                       for f in sorted(os.listdir(metadata_dir))]
+    metadata_files = {op.abspath(f): pc.file_fingerprint(f, hash_content=True)
+                      for f in metadata_files}
+
+    return {'table': table, 'arguments': arguments, 'data_files': data_files,
+            'metadata_files': metadata_files}
+
 
 def merge_tables(county=None, meta_files=METADATA_FILES, data_dir=None,
-                 paths=None, files=None, groups=True, name_exclusion=False):
+                 paths=None, files=None, groups=True, name_exclusion=False,
+                 n_jobs=1, executor=None, cache_dir=None,
+                 incremental_dir=None):
     """ Run all functions that clean up raw tables separately, and merge them
         all into the enrollment table, where each row represents the project
         enrollment of an individual.
 
+        Wrap the call in a puget.instrument.StageReport to record the time
+        and memory used by each stage (reading, deduplication & cleaning of
+        each table, each merge and the DOB clean-up).
+
         Parameters
         ----------
         county: string
@@ -870,6 +1665,29 @@ def merge_tables(county=None, meta_files=METADATA_FILES, data_dir=None,
         paths : list
             list of directories inside data_dir to look for csv files in
 
+        n_jobs : int
+            Number of processes to use to run the table cleaning stages
+            (get_enrollment, get_client, ...) concurrently. Default is 1.
+
+        executor : concurrent.futures.Executor
+            If provided, the table cleaning stages are run on this executor
+            and n_jobs is ignored. Default is None.
+
+        cache_dir : string
+            If provided, directory of an on-disk cache of the cleaned tables
+            (see get_table). Default is None.
+
+        incremental_dir : string
+            If provided, directory to keep the cleaned tables, the merged
+            output and a manifest of the folders & files they came from
+            (requires pyarrow). When later calls find new folders (e.g. a new
+            year of exports), only the rows of the people, enrollments,
+            households and projects that appear in the new folders are
+            cleaned again, and the rest is reused. If the metadata, the
+            arguments or any previously read file changed, the tables are
+            rebuilt from scratch. The order of the rows can differ from a
+            full rebuild. Default is None.
+
         Returns
         ----------
         dataframe with rows representing the record of a person per
@@ -878,226 +1696,458 @@ def merge_tables(county=None, meta_files=METADATA_FILES, data_dir=None,
     if not isinstance(files, dict):
         files = {}
 
+    # The table cleaning stages don't depend on each other, so run them all
+    # (concurrently if requested) before doing the joins
+    stage_kwargs = {'enrollment': {'groups': groups},
+                    'client': {'name_exclusion': name_exclusion}}
+    if incremental_dir is not None:
+        manifest = _read_manifest(incremental_dir)
+    stages = {}
+    for name in TABLE_GETTERS:
+        kwargs = dict(stage_kwargs.get(name, {}), county=county,
+                      file_spec=files.get(name, None),
+                      metadata_file=meta_files.get(name, None),
+                      data_dir=data_dir, paths=paths)
+        if incremental_dir is None:
+            stages[name] = (get_table, dict(kwargs, table=name,
+                                            cache_dir=cache_dir))
+        else:
+            stages[name] = (_update_table,
+                            {'table': name, 'kwargs': kwargs,
+                             'incremental_dir': incremental_dir,
+                             'entry': manifest['tables'].get(name),
+                             'cache_dir': cache_dir})
+    tables = _run_stages(stages, n_jobs=n_jobs, executor=executor)
+
+    if incremental_dir is not None:
+        entries = {name: entry for name, (df, entry) in tables.items()}
+        tables = {name: df for name, (df, entry) in tables.items()}
+        # Nothing changed since the last call, reuse the merged output
+        merged_file = manifest['merged_file']
+        if entries == manifest['tables'] and merged_file is not None and \
+                op.exists(op.join(incremental_dir, merged_file)):
+            return pd.read_parquet(op.join(incremental_dir, merged_file))
+
     # Get enrollment data
-    enroll = get_enrollment(county=county,
-                            file_spec=files.get('enrollment', None),
-                            metadata_file=meta_files.get('enrollment', None),
-                            groups=groups, data_dir=data_dir,
-                            paths=paths)
+    enroll = tables['enrollment']
     print('enroll n_rows:', len(enroll))
-    enrollment_metadata = get_metadata_dict(meta_files.get('enrollment',
-                                            METADATA_FILES['enrollment']))
-    enrollment_enid_column = enrollment_metadata['person_enrollment_ID']
-    enrollment_pid_column = enrollment_metadata['person_ID']
-    enrollment_prid_column = enrollment_metadata['program_ID']
+    enrollment_metadata = pm.get_schema(
+        meta_files.get('enrollment', METADATA_FILES['enrollment']))
+    enrollment_enid_column = enrollment_metadata.person_enrollment_ID
+    enrollment_pid_column = enrollment_metadata.person_ID
+    enrollment_prid_column = enrollment_metadata.program_ID
     # print(enroll)
 
     # Merge exit in
-    exit_table = get_exit(county=county, file_spec=files.get('exit', None),
-                          metadata_file=meta_files.get('exit', None),
-                          data_dir=data_dir, paths=paths)
+    exit_table = tables['exit']
     print('exit n_rows:', len(exit_table))
-    exit_metadata = get_metadata_dict(meta_files.get('exit',
-                                      METADATA_FILES['exit']))
-    exit_ppid_column = exit_metadata['person_enrollment_ID']
+    exit_metadata = pm.get_schema(
+        meta_files.get('exit', METADATA_FILES['exit']))
+    exit_ppid_column = exit_metadata.person_enrollment_ID
 
-    enroll_merge = pd.merge(left=enroll, right=exit_table, how='left',
-                            left_on=enrollment_enid_column,
-                            right_on=exit_ppid_column)
+    with pi.stage('merge', table='exit') as record:
+        enroll_merge = pd.merge(left=enroll, right=exit_table, how='left',
+                                left_on=enrollment_enid_column,
+                                right_on=exit_ppid_column)
 
-    if enrollment_enid_column != exit_ppid_column and \
-            exit_ppid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(exit_ppid_column, axis=1)
+        if enrollment_enid_column != exit_ppid_column and \
+                exit_ppid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(exit_ppid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
 
     # Merge client in
-    client = get_client(county=county, file_spec=files.get('client', None),
-                        metadata_file=meta_files.get('client', None),
-                        data_dir=data_dir, paths=paths,
-                        name_exclusion=name_exclusion)
-
+    client = tables['client']
     print('client n_rows:', len(client))
-    client_metadata = get_metadata_dict(meta_files.get('client',
-                                        METADATA_FILES['client']))
-    client_pid_column = client_metadata['person_ID']
-    dob_column = client_metadata['dob_column']
-    n_bad_dob = 0
+    client_metadata = pm.get_schema(
+        meta_files.get('client', METADATA_FILES['client']))
+    client_pid_column = client_metadata.person_ID
+    dob_column = client_metadata.dob_column
     # set any DOBs to NaNs if they are in the future relative to the earliest
     # enrollment. Also set to NaN if the DOB is too early (pre 1900)
-    gb = client.groupby(client_pid_column)
-    for pid, group in gb:
-        enroll_dates = enroll_merge[enroll_merge[enrollment_pid_column] ==
-                                    pid][enrollment_metadata['entry_date']]
-        earliest_enrollment = enroll_dates.min()
-
-        bad_dob = np.logical_or(group[dob_column] > earliest_enrollment,
-                                group[dob_column] < pd.to_datetime(
+    with pi.stage('bad_dob', table='client') as record:
+        earliest_enrollment = enroll_merge.groupby(enrollment_pid_column)[
+            enrollment_metadata.entry_date].min()
+        client_earliest = client[client_pid_column].map(earliest_enrollment)
+        bad_dob = np.logical_or(client[dob_column] > client_earliest,
+                                client[dob_column] < pd.to_datetime(
                                     '1900/1/1', format='%Y/%m/%d'))
-        n_bad_dob += np.sum(bad_dob)
-        n_entries = group.shape[0]
-
-        if np.sum(bad_dob) > 0:
-            if n_entries == 1:
-                client.loc[group.index, dob_column] = pd.NaT
-            else:
-                if max(group[dob_column]) == min(group[dob_column]):
-                    client.loc[group.index, dob_column] = pd.NaT
-                else:
-                    client.loc[group.index[np.where(bad_dob)],
-                               dob_column] = pd.NaT
-
-    gb = client.groupby(client_pid_column)
-    for pid, group in gb:
-        n_entries = group.shape[0]
-        if n_entries > 1:
-            # for differences in DOB, if the difference is less than
-            # a year then take the midpoint, otherwise set to NaN
-            if len(np.unique(group[dob_column])) > 1:
-                is_valid = ~pd.isnull(group[dob_column])
-                n_valid = np.sum(is_valid)
-                if n_valid == 1:
-                    client.loc[group.index, dob_column] = \
-                        group[dob_column][is_valid].values[0]
-                elif n_valid > 1:
-                    t_diff = (np.max(group[dob_column]) -
-                              np.min(group[dob_column]))
-                    if t_diff < datetime.timedelta(365):
-                        t_diff_sec = t_diff.seconds + 86400 * t_diff.days
-                        new_date = (np.min(group[dob_column]) +
-                                    datetime.timedelta(
-                                        seconds=t_diff_sec / 2.)).date()
-                        client.loc[group.index, dob_column] = \
-                            pd.datetime(new_date.year, new_date.month,
-                                        new_date.day)
-                    else:
-                        client.loc[group.index, dob_column] = pd.NaT
-
-    # now drop duplicates
-    client = client.drop_duplicates(client_metadata['duplicate_check_columns'],
-                                    keep='last', inplace=False)
+        n_bad_dob = np.sum(bad_dob)
+        client.loc[bad_dob, dob_column] = pd.NaT
+        pi.set_shape(record, client)
+
+    with pi.stage('dob_conflicts', table='client') as record:
+        # for differences in DOB, if the difference is less than
+        # a year then take the midpoint, otherwise set to NaN
+        client[dob_column] = _resolve_time_conflicts(
+            client.groupby(client_pid_column)[dob_column])
+
+        # now drop duplicates
+        client = client.drop_duplicates(
+            list(client_metadata.duplicate_check_columns), keep='last',
+            inplace=False)
+        pi.set_shape(record, client)
 
     print('Found %d entries with bad DOBs' % n_bad_dob)
 
-    enroll_merge = pd.merge(left=enroll_merge, right=client, how='right',
-                            left_on=enrollment_pid_column,
-                            right_on=client_pid_column)
+    with pi.stage('merge', table='client') as record:
+        enroll_merge = pd.merge(left=enroll_merge, right=client, how='right',
+                                left_on=enrollment_pid_column,
+                                right_on=client_pid_column)
 
-    if enrollment_pid_column != client_pid_column and \
-            client_pid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(client_pid_column, axis=1)
+        if enrollment_pid_column != client_pid_column and \
+                client_pid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(client_pid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
 
     # Merge disabilities in
-    disabilities = get_disabilities(county=county,
-                                    file_spec=files.get('disabilities', None),
-                                    metadata_file=meta_files.get('disabilities', None),
-                                    data_dir=data_dir,
-                                    paths=paths)
+    disabilities = tables['disabilities']
     print('disabilities n_rows:', len(disabilities))
-    disabilities_metadata = get_metadata_dict(meta_files.get('disabilities',
-                                              METADATA_FILES['disabilities']))
-    disabilities_ppid_column = disabilities_metadata['person_enrollment_ID']
-    enroll_merge = enroll_merge.merge(disabilities, how='left',
-                                      left_on=enrollment_enid_column,
-                                      right_on=disabilities_ppid_column)
-
-    if enrollment_enid_column != disabilities_ppid_column and \
-            disabilities_ppid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(disabilities_ppid_column, axis=1)
+    disabilities_metadata = pm.get_schema(
+        meta_files.get('disabilities', METADATA_FILES['disabilities']))
+    disabilities_ppid_column = disabilities_metadata.person_enrollment_ID
+    with pi.stage('merge', table='disabilities') as record:
+        enroll_merge = enroll_merge.merge(disabilities, how='left',
+                                          left_on=enrollment_enid_column,
+                                          right_on=disabilities_ppid_column)
+
+        if enrollment_enid_column != disabilities_ppid_column and \
+                disabilities_ppid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(disabilities_ppid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
 
     # Merge employment_education in
-    emp_edu = get_employment_education(county=county,
-                                       file_spec=files.get('employment_education', None),
-                                       metadata_file=meta_files.get('employment_education', None),
-                                       data_dir=data_dir, paths=paths)
+    emp_edu = tables['employment_education']
     print('emp_edu n_rows:', len(emp_edu))
-    emp_edu_metadata = get_metadata_dict(meta_files.get('employment_education',
-                                         METADATA_FILES['employment_education']))
-    emp_edu_ppid_column = emp_edu_metadata['person_enrollment_ID']
-    enroll_merge = enroll_merge.merge(emp_edu, how='left',
-                                      left_on=enrollment_enid_column,
-                                      right_on=emp_edu_ppid_column)
-
-    if enrollment_enid_column != emp_edu_ppid_column and \
-            emp_edu_ppid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(emp_edu_ppid_column, axis=1)
+    emp_edu_metadata = pm.get_schema(
+        meta_files.get('employment_education',
+                       METADATA_FILES['employment_education']))
+    emp_edu_ppid_column = emp_edu_metadata.person_enrollment_ID
+    with pi.stage('merge', table='employment_education') as record:
+        enroll_merge = enroll_merge.merge(emp_edu, how='left',
+                                          left_on=enrollment_enid_column,
+                                          right_on=emp_edu_ppid_column)
+
+        if enrollment_enid_column != emp_edu_ppid_column and \
+                emp_edu_ppid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(emp_edu_ppid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
 
     # Merge health in
-    health_dv = get_health_dv(county=county,
-                              file_spec=files.get('health_dv', None),
-                              metadata_file=meta_files.get('health_dv', None),
-                              data_dir=data_dir, paths=paths)
+    health_dv = tables['health_dv']
     print('health_dv n_rows:', len(health_dv))
-    health_dv_metadata = get_metadata_dict(meta_files.get('health_dv',
-                                           METADATA_FILES['health_dv']))
-    health_dv_ppid_column = health_dv_metadata['person_enrollment_ID']
-    enroll_merge = enroll_merge.merge(health_dv, how='left',
-                                      left_on=enrollment_enid_column,
-                                      right_on=health_dv_ppid_column)
-
-    if enrollment_enid_column != health_dv_ppid_column and \
-            health_dv_ppid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(health_dv_ppid_column, axis=1)
+    health_dv_metadata = pm.get_schema(
+        meta_files.get('health_dv', METADATA_FILES['health_dv']))
+    health_dv_ppid_column = health_dv_metadata.person_enrollment_ID
+    with pi.stage('merge', table='health_dv') as record:
+        enroll_merge = enroll_merge.merge(health_dv, how='left',
+                                          left_on=enrollment_enid_column,
+                                          right_on=health_dv_ppid_column)
+
+        if enrollment_enid_column != health_dv_ppid_column and \
+                health_dv_ppid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(health_dv_ppid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
 
     # Merge income in
-    income = get_income(county=county, file_spec=files.get('income', None),
-                        metadata_file=meta_files.get('income', None),
-                        data_dir=data_dir, paths=paths)
+    income = tables['income']
     print('income n_rows:', len(income))
-    income_metadata = get_metadata_dict(meta_files.get('income',
-                                        METADATA_FILES['income']))
-    income_ppid_column = income_metadata['person_enrollment_ID']
-    enroll_merge = enroll_merge.merge(income, how='left',
-                                      left_on=enrollment_enid_column,
-                                      right_on=income_ppid_column)
-
-    if enrollment_enid_column != income_ppid_column and \
-            income_ppid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(income_ppid_column, axis=1)
+    income_metadata = pm.get_schema(
+        meta_files.get('income', METADATA_FILES['income']))
+    income_ppid_column = income_metadata.person_enrollment_ID
+    with pi.stage('merge', table='income') as record:
+        enroll_merge = enroll_merge.merge(income, how='left',
+                                          left_on=enrollment_enid_column,
+                                          right_on=income_ppid_column)
+
+        if enrollment_enid_column != income_ppid_column and \
+                income_ppid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(income_ppid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
 
     # Merge project in
-    project = get_project(county=county, file_spec=files.get('project', None),
-                          metadata_file=meta_files.get('project', None),
-                          data_dir=data_dir, paths=paths)
+    project = tables['project']
     print('project n_rows:', len(project))
-    project_metadata = get_metadata_dict(meta_files.get('project',
-                                         METADATA_FILES['project']))
-    project_prid_column = project_metadata['program_ID']
-    enroll_merge = enroll_merge.merge(project, how='left',
-                                      left_on=enrollment_prid_column,
-                                      right_on=project_prid_column)
+    project_metadata = pm.get_schema(
+        meta_files.get('project', METADATA_FILES['project']))
+    project_prid_column = project_metadata.program_ID
+    with pi.stage('merge', table='project') as record:
+        enroll_merge = enroll_merge.merge(project, how='left',
+                                          left_on=enrollment_prid_column,
+                                          right_on=project_prid_column)
+
+        if enrollment_prid_column != project_prid_column and \
+                project_prid_column in enroll_merge.columns:
+            enroll_merge = enroll_merge.drop(project_prid_column, axis=1)
+        pi.set_shape(record, enroll_merge)
+
+    if incremental_dir is not None:
+        _write_incremental_output(enroll_merge, entries, incremental_dir)
 
-    if enrollment_prid_column != project_prid_column and \
-            project_prid_column in enroll_merge.columns:
-        enroll_merge = enroll_merge.drop(project_prid_column, axis=1)
+    return enroll_merge
 
 
-    return enroll_merge
+def _run_stages(stages, n_jobs=1, executor=None):
+    """
+    Run independent table cleaning stages, concurrently if requested.
+
+    Parameters
+    ----------
+    stages : dict
+        keys are stage names, values are (function, kwargs) tuples
+
+    n_jobs : int
+        Number of processes to use if no executor is provided
 
+    executor : concurrent.futures.Executor
+        Executor to submit the stages to. Default is None.
 
-def _has_digit(my_str):
-    return any(char.isdigit() for char in my_str)
+    Returns
+    ----------
+    dict with the same keys as stages and the returned dataframes as values
+    """
+    if executor is None and n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            return _run_stages(stages, executor=pool)
+
+    # Record the stages in the process they run in, then add the records
+    # to the active report
+    instrumented = pi.is_active()
+    if instrumented:
+        stages = {name: (_instrumented_stage,
+                         {'name': name, 'func': func, 'kwargs': kwargs})
+                  for name, (func, kwargs) in stages.items()}
+
+    if executor is None:
+        results = {name: func(**kwargs)
+                   for name, (func, kwargs) in stages.items()}
+    else:
+        futures = {name: executor.submit(func, **kwargs)
+                   for name, (func, kwargs) in stages.items()}
+        results = {name: future.result() for name, future in futures.items()}
 
-def _is_in_exclusion(my_str, exclusion_list):
-    for item in exclusion_list:
-        if item in my_str:
-            return True
-    return False
+    if instrumented:
+        for name, (result, records) in results.items():
+            pi.add_records(records)
+            results[name] = result
+    return results
 
-def _name_exclude(row,
-                  name_cols,
-                  exclusion_list=NAME_EXCLUSION):
+
+def _instrumented_stage(name, func, kwargs):
+    """
+    Run a table cleaning stage with a report of its own.
+
+    Returns
+    ----------
+    the result of the stage and the list of records
     """
-    Criteria for name exclusion. Returns True for keepers.
+    with pi.StageReport() as report:
+        with pi.stage('clean', table=name) as record:
+            result = func(**kwargs)
+            # incremental stages return the table and its manifest entry
+            df = result[0] if isinstance(result, tuple) else result
+            pi.set_shape(record, df)
+    return result, report.records
+
+
+def _update_table(table, kwargs, incremental_dir, entry=None, cache_dir=None):
+    """
+    Clean a table for an incremental merge_tables, only cleaning the rows of
+    keys (see TABLE_KEYS) that appear in folders that are not in the
+    previous manifest entry of the table again.
+
+    Parameters
+    ----------
+    table : string
+        table type, must be a key in TABLE_GETTERS (e.g. 'client')
+
+    kwargs : dict
+        arguments for the get_* function for the table
+
+    incremental_dir : string
+        directory with the stored tables and the manifest
+
+    entry : dict
+        manifest entry of the table from the previous call, None if there is
+        none. Default is None.
+
+    cache_dir : string
+        passed to get_table when the table is rebuilt from scratch
+
+    Returns
+    ----------
+    the cleaned dataframe and the new manifest entry (None if the table
+    could not be stored)
+    """
+    func = TABLE_GETTERS[table]
+    inputs = _table_cache_inputs(table, func, kwargs)
+    folders = [{'path': path, 'file': fname, 'fingerprint': fingerprint}
+               for path, (fname, fingerprint)
+               in inputs.pop('data_files').items()]
+    # Where the folders are is tracked by the folder list, so adding a folder
+    # to paths doesn't change the settings
+    for arg in ['county', 'file_spec', 'data_dir', 'paths']:
+        inputs['arguments'].pop(arg)
+    settings = pc.cache_key(inputs)
+
+    schema = pm.get_schema(inputs['arguments']['metadata_file'])
+    encoding = schema['encoding'] if 'encoding' in schema else None
+    key_column = getattr(schema, TABLE_KEYS[table])
+
+    old_folders = {}
+    if entry is not None and entry['settings'] == settings and \
+            op.exists(op.join(incremental_dir, entry['table_file'])):
+        old_folders = {folder['path']: folder for folder in entry['folders']}
+    current = {folder['path']: folder for folder in folders}
+    rebuild = len(old_folders) == 0 or any(
+        path not in current or
+        current[path] != {k: v for k, v in folder.items() if k != 'raw_file'}
+        for path, folder in old_folders.items())
+    new_folders = [folder for folder in folders
+                   if folder['path'] not in old_folders]
+
+    if not rebuild and len(new_folders) == 0:
+        return pd.read_parquet(op.join(incremental_dir,
+                                       entry['table_file'])), entry
+
+    new_raw = {}
+    for folder in (folders if rebuild else new_folders):
+        new_raw[folder['path']] = _read_raw(folder['file'], encoding)
+        folder['raw_file'] = op.join('raw', table, '%s_%s.parquet' % (
+            table, pc.cache_key(folder)[:24]))
+    if not rebuild:
+        for path, folder in old_folders.items():
+            current[path]['raw_file'] = folder['raw_file']
+
+    affected = pd.concat([df_raw[key_column] for df_raw in new_raw.values()])
+    if affected.isnull().any():
+        # rows without a key can't be cleaned separately
+        rebuild = True
+    affected = set(affected)
+
+    if rebuild:
+        df = get_table(table, cache_dir=cache_dir, **kwargs)
+    else:
+        df = pd.read_parquet(op.join(incremental_dir, entry['table_file']))
+        df = df[~_key_isin(df[key_column], affected)]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Write the rows with the affected keys of all the folders (in the
+            # same order) to temporary files and clean them
+            subset_spec = {}
+            for i, folder in enumerate(folders):
+                if folder['path'] in new_raw:
+                    df_raw = new_raw[folder['path']]
+                    df_raw = df_raw[df_raw[key_column].isin(affected)]
+                else:
+                    df_raw = pd.read_parquet(
+                        op.join(incremental_dir, folder['raw_file']),
+                        filters=[(key_column, 'in', list(affected))])
+                if df_raw.shape[0] > 0:
+                    subset_spec[folder['path']] = op.join(temp_dir,
+                                                          '%d.csv' % i)
+                    df_raw.to_csv(subset_spec[folder['path']], index=False,
+                                  encoding=encoding)
+            if len(subset_spec) > 0:
+                df_new = func(**dict(kwargs, file_spec=subset_spec,
+                                     county=None, data_dir=None, paths=None))
+                df = pd.concat([df, df_new], ignore_index=True)
+
+    # Store the raw rows of the new folders and the cleaned table
+    stored = True
+    for folder in folders:
+        if folder['path'] in new_raw:
+            stored &= pc.write_cached(new_raw.pop(folder['path']),
+                                      op.join(incremental_dir,
+                                              folder['raw_file']))
+    entry = {'settings': settings, 'key_column': key_column,
+             'folders': folders}
+    entry['table_file'] = op.join('tables', '%s_%s.parquet' % (
+        table, pc.cache_key(entry)[:24]))
+    stored &= pc.write_cached(df, op.join(incremental_dir,
+                                          entry['table_file']))
+    return df, (entry if stored else None)
+
+
+def _read_raw(fname, encoding=None):
+    """Read a raw csv file with all values as strings."""
+    return _strip_bom(pd.read_csv(fname, dtype=str, encoding=encoding))
+
+
+def _key_isin(values, keys):
+    """
+    Find the values of a key column of a cleaned table that are in a set of
+    keys read as strings from the raw files.
+    """
+    keys = pd.Series(list(keys), dtype=object)
+    if pd.api.types.is_numeric_dtype(values):
+        keys = pd.to_numeric(keys, errors='coerce').dropna()
+    else:
+        values = values.astype(str)
+    return values.isin(keys)
+
+
+def _read_manifest(incremental_dir):
+    """Read the manifest of an incremental merge_tables directory."""
+    fname = op.join(incremental_dir, 'manifest.json')
+    if not op.exists(fname):
+        return {'tables': {}, 'merged_file': None}
+    with open(fname) as f:
+        return json.load(f)
+
+
+def _write_incremental_output(df, entries, incremental_dir):
+    """
+    Store the merged output of an incremental merge_tables, then write the
+    manifest and remove the files that it no longer refers to.
+    """
+    entries = {name: entry for name, entry in entries.items()
+               if entry is not None}
+    merged_file = 'merged_%s.parquet' % pc.cache_key(entries)[:24]
+    if not pc.write_cached(df, op.join(incremental_dir, merged_file)):
+        merged_file = None
+    manifest = {'tables': entries, 'merged_file': merged_file}
+
+    fd, temp_fname = tempfile.mkstemp(dir=incremental_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_fname, op.join(incremental_dir, 'manifest.json'))
+
+    in_use = {merged_file}
+    for entry in entries.values():
+        in_use.add(entry['table_file'])
+        in_use.update(folder['raw_file'] for folder in entry['folders'])
+    for root, dirs, fnames in os.walk(incremental_dir):
+        for fname in fnames:
+            fname = op.relpath(op.join(root, fname), incremental_dir)
+            if fname.endswith('.parquet') and fname not in in_use:
+                os.remove(op.join(incremental_dir, fname))
+
+
+def _keep_by_name(df, name_cols, exclusion_list=NAME_EXCLUSION):
+    """
+    Criteria for name exclusion, over all rows at once.
+
+    A row is excluded if any of its names is missing or not a string, or
+    (ignoring case & periods) contains one of the items of exclusion_list,
+    is a single character or contains a digit.
+
+    Returns
+    ----------
+    boolean Series, True for keepers
     """
+    excluded = re.compile('|'.join(re.escape(item.lower())
+                                   for item in exclusion_list))
+    keep = pd.Series(True, index=df.index)
     for c in name_cols:
-        if pd.isnull(row[c]):
-            return False
-        if isinstance(row[c], (float, int)):
-            return False
-        name = row[c].lower().replace('.', '')
-        if _is_in_exclusion(name, exclusion_list):
-            return False
-        if len(name) == 1:
-            return False
-        if _has_digit(name):
-            return False
-    return True
\ No newline at end of file
+        # category & string columns are checked element by element too
+        names = df[c].astype(object)
+        if pd.api.types.infer_dtype(names, skipna=True) not in (
+                'string', 'mixed', 'mixed-integer'):
+            # no string names at all (e.g. all missing or all numeric)
+            return pd.Series(False, index=df.index)
+        # non-string names become NaN
+        names = names.str.lower().str.replace('.', '', regex=False)
+        keep &= (names.notnull() &
+                 ~names.str.contains(excluded, na=True) &
+                 (names.str.len() != 1) &
+                 ~names.str.contains(r'\d', na=True))
+    return keep
@@ -1,23 +1,93 @@
 """
 
 """
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 import recordlinkage as rl
 import networkx
 
 
 MATCH_THRESHOLD = 0.5
 STRING_THRESHOLD = 0.85
+# Maximal number of candidate pairs compared at a time
+SHARD_SIZE = 1000000
+
 
-def block_and_match(df, block_variable, comparison_dict, match_threshold=MATCH_THRESHOLD,
-                    string_method="jarowinkler", string_threshold=STRING_THRESHOLD):
+def block_pairs(df, block_variable, shard_size=SHARD_SIZE):
     """
-    Use recordlinkage to block on one variable and compare on others
+    Generate the candidate pairs of records that have the same value of the
+    blocking variable, in shards.
+
+    The pairs are the same as those of recordlinkage's block index: each
+    pair of records of a block as (later record, earlier record). Records
+    with a missing value are not in any block. The pairs are only built one
+    shard at a time, so this works for blocks with more pairs than fit in
+    memory.
+
+    Parameters
+    ----------
+    df : DataFrame
+        The records, with a unique index.
+
+    block_variable : string
+        The column to block on.
 
+    shard_size : int, optional
+        The number of pairs in each shard. A shard can be larger when a
+        record is paired with more records than this.
+
+    Yields
+    ------
+    Two arrays with the positions (in df) of the later & earlier record of
+    each pair of a shard
+    """
+    codes = pd.factorize(df[block_variable])[0]
+    valid = np.flatnonzero(codes >= 0)
+    # records sorted by block, in order of appearance within each block
+    order = valid[np.argsort(codes[valid], kind='mergesort')]
+    sorted_codes = codes[order]
+    block_start = np.searchsorted(sorted_codes, sorted_codes, side='left')
+    # each record pairs with the preceding records of its block
+    n_pairs = np.arange(order.shape[0]) - block_start
+    cum_pairs = np.cumsum(n_pairs)
+
+    start = 0
+    while start < order.shape[0]:
+        done = cum_pairs[start - 1] if start > 0 else 0
+        stop = max(np.searchsorted(cum_pairs, done + shard_size,
+                                   side='right'), start + 1)
+        shard_pairs = n_pairs[start:stop]
+        later = np.repeat(np.arange(start, stop), shard_pairs)
+        # offset of each pair within the pairs of its later record
+        offset = np.arange(later.shape[0]) - np.repeat(
+            np.cumsum(shard_pairs) - shard_pairs, shard_pairs)
+        if later.shape[0] > 0:
+            yield order[later], order[block_start[later] + offset]
+        start = stop
+
+
+def _compare_shard(df, later, earlier, comparison_dict, match_threshold,
+                   string_method, string_threshold):
     """
+    Compute the comparison features of a shard of pairs of records.
+
+    Parameters
+    ----------
+    df : DataFrame
+        The records of the shard.
+
+    later, earlier : arrays
+        Positions (in df) of the records of each pair.
 
-    indexer = rl.BlockIndex(on=block_variable)
-    pairs = indexer.index(df)
+    Returns
+    -------
+    DataFrame with the features of each pair, their mean and whether the
+    pair is a match, indexed by the pairs of labels of the records
+    """
+    pairs = pd.MultiIndex.from_arrays([df.index[later], df.index[earlier]])
     compare = rl.Compare()
     for k, v in comparison_dict.items():
         if v == "string":
@@ -30,12 +100,93 @@ def block_and_match(df, block_variable, comparison_dict, match_threshold=MATCH_T
     features = compare.compute(pairs, df)
     features["mean"] = features.mean(axis=1, skipna=True)
     features["match"] = features["mean"] > match_threshold
-
     return features
 
 
+def iter_block_and_match(df, block_variable, comparison_dict,
+                         match_threshold=MATCH_THRESHOLD,
+                         string_method="jarowinkler",
+                         string_threshold=STRING_THRESHOLD, n_jobs=1,
+                         shard_size=SHARD_SIZE):
+    """
+    Block on one variable and compare on others, one shard of candidate
+    pairs at a time (see block_pairs).
+
+    With n_jobs > 1 the shards are compared in a pool of processes, with at
+    most twice as many shards in flight as there are processes, so the
+    features of all pairs are never held in memory at once.
+
+    Parameters
+    ----------
+    n_jobs : int, optional
+        The number of processes comparing shards. Default: 1, which compares
+        them in this process.
+
+    shard_size : int, optional
+        The number of pairs in each shard.
+
+    Yields
+    ------
+    DataFrame with the features of the pairs of a shard (see
+    block_and_match), in the order of the shards
+    """
+    args = (comparison_dict, match_threshold, string_method,
+            string_threshold)
+
+    def shards():
+        for later, earlier in block_pairs(df, block_variable,
+                                          shard_size=shard_size):
+            # send only the records of the shard to the workers
+            rows, positions = np.unique(np.concatenate([later, earlier]),
+                                        return_inverse=True)
+            yield (df.iloc[rows], positions[:later.shape[0]],
+                   positions[later.shape[0]:])
+
+    if n_jobs == 1:
+        for shard in shards():
+            yield _compare_shard(*shard, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = deque()
+        for shard in shards():
+            if len(futures) >= 2 * n_jobs:
+                yield futures.popleft().result()
+            futures.append(executor.submit(_compare_shard, *shard, *args))
+        while futures:
+            yield futures.popleft().result()
+
+
+def block_and_match(df, block_variable, comparison_dict,
+                    match_threshold=MATCH_THRESHOLD,
+                    string_method="jarowinkler",
+                    string_threshold=STRING_THRESHOLD,
+                    n_jobs=1, shard_size=SHARD_SIZE):
+    """
+    Use recordlinkage to block on one variable and compare on others
+
+    The candidate pairs are compared in shards, in parallel if n_jobs > 1
+    (see iter_block_and_match).
+    """
+    features = list(iter_block_and_match(df, block_variable,
+                                         comparison_dict,
+                                         match_threshold=match_threshold,
+                                         string_method=string_method,
+                                         string_threshold=string_threshold,
+                                         n_jobs=n_jobs,
+                                         shard_size=shard_size))
+    if len(features) == 0:
+        return _compare_shard(df, np.array([], dtype=int),
+                              np.array([], dtype=int),
+                              comparison_dict, match_threshold,
+                              string_method, string_threshold)
+    return pd.concat(features)
+
+
 def link_records(prelink_ids, link_list, match_threshold=MATCH_THRESHOLD,
-                 string_method="jarowinkler", string_threshold=STRING_THRESHOLD):
+                 string_method="jarowinkler",
+                 string_threshold=STRING_THRESHOLD,
+                 n_jobs=1, shard_size=SHARD_SIZE):
     """
     Link records from a dataset, using an iterative approach
 
@@ -58,16 +209,22 @@ def link_records(prelink_ids, link_list, match_threshold=MATCH_THRESHOLD,
                                   "lname": "string",
                                   "dob":"date"}}]
 
+    n_jobs : int, optional
+        The number of processes comparing candidate pairs (see
+        iter_block_and_match). Default: 1.
+
+    shard_size : int, optional
+        The number of candidate pairs compared at a time. Only the matches
+        of each shard are kept.
     """
     matches = []
     for link in link_list:
-        features = block_and_match(prelink_ids,
-                                   link['block_variable'],
-                                   link['match_variables'],
-                                   match_threshold=match_threshold,
-                                   string_method=string_method,
-                                   string_threshold=string_threshold)
-        matches.append(features[features["match"]])
+        for features in iter_block_and_match(
+                prelink_ids, link['block_variable'], link['match_variables'],
+                match_threshold=match_threshold, string_method=string_method,
+                string_threshold=string_threshold, n_jobs=n_jobs,
+                shard_size=shard_size):
+            matches.append(features[features["match"]])
 
     G = networkx.Graph()
     for match in matches:
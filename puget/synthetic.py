@@ -0,0 +1,389 @@
+"""
+Synthetic HMIS extracts, for benchmarks and tests.
+
+make_county writes a county folder tree with the csv tables that the get_*
+functions read (Client.csv, Enrollment.csv, Exit.csv, Disabilities.csv,
+EmploymentEducation.csv, HealthAndDV.csv, IncomeBenefits.csv and
+Project.csv), with the column names of the packaged metadata. The data are
+random but have the features the clean-up has to deal with: households,
+people with several enrollments, records repeated across the yearly
+exports, conflicting client records, unknown codes (8, 9, 99) and names that
+are excluded by the name exclusion.
+"""
+import os
+import os.path as op
+
+import numpy as np
+import pandas as pd
+
+from .preprocess import TABLE_FILES, CATEGORICAL_UNKNOWN, NAME_EXCLUSION
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer',
+               'Michael', 'Linda', 'William', 'Elizabeth', 'David', 'Barbara',
+               'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Charles', 'Karen', 'Maria', 'Jose', 'Nguyen', 'Ahmed']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia',
+              'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez',
+              'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson',
+              'Martin', 'Lee', 'Tran', 'Kim', 'Ali', 'Begay']
+
+CLIENT_BOOLEAN = ['AmIndAKNative', 'Asian', 'BlackAfAmerican',
+                  'NativeHIOtherPacific', 'White', 'Ethnicity',
+                  'VeteranStatus', 'WorldWarII', 'KoreanWar', 'VietnamWar',
+                  'DesertStorm', 'AfghanistanOEF', 'IraqOIF', 'IraqOND',
+                  'OtherTheater']
+INCOME_SOURCES = ['Earned', 'TANF', 'GA', 'ChildSupport']
+BENEFITS = ['SNAP', 'WIC', 'TANFChildCare', 'RentalAssistanceOngoing',
+            'RentalAssistanceTemp']
+INSURANCE = ['Medicaid', 'Medicare', 'SCHIP']
+
+ENTRY_STAGE = 1
+EXIT_STAGE = 3
+
+
+def make_county(data_dir, paths=('2014', '2015', '2016'), n_clients=1000,
+                enrollments_per_household=1.5, duplicate_rate=0.1,
+                conflict_rate=0.02, unknown_rate=0.05, seed=None):
+    """
+    Write a synthetic county folder tree of HMIS csv tables.
+
+    Parameters
+    ----------
+    data_dir : string
+        full path of the county folder to write the tables in. One folder per
+        entry of paths is created in it.
+
+    paths : list
+        names of the yearly export folders. Enrollments are spread over the
+        years in order. Default is ('2014', '2015', '2016').
+
+    n_clients : int
+        number of people. The enrollment-level tables have about
+        n_clients * enrollments_per_household rows (times two for the tables
+        with entry & exit records). Default is 1000.
+
+    enrollments_per_household : float
+        mean number of enrollments of each household. Default is 1.5.
+
+    duplicate_rate : float
+        fraction of the rows of each table that are exported again in the
+        next folder (or twice in the last folder). Default is 0.1.
+
+    conflict_rate : float
+        fraction of people with a second client record with a different DOB
+        and race. Default is 0.02.
+
+    unknown_rate : float
+        fraction of categorical values that are unknown codes (8, 9, 99).
+        Default is 0.05.
+
+    seed : int
+        seed of the random number generator. Default is None.
+
+    Returns
+    ----------
+    dict with the number of rows written for each table type
+    """
+    rng = np.random.RandomState(seed)
+    paths = [str(path) for path in paths]
+    first_year = _folder_year(paths[0], 0)
+
+    client = _make_client(rng, n_clients, unknown_rate)
+    households = _make_households(rng, n_clients)
+    enrollment = _make_enrollment(rng, households, enrollments_per_household,
+                                  len(paths), first_year, unknown_rate)
+    project = _make_project(rng, max(5, n_clients // 200))
+    enrollment['ProjectID'] = rng.choice(project['ProjectID'].values,
+                                         enrollment.shape[0])
+    exit_table = _make_exit(rng, enrollment, unknown_rate)
+
+    # which folder each enrollment-level record is exported in
+    folder = enrollment.set_index('ProjectEntryID')['folder']
+    exited = exit_table['ProjectEntryID']
+    stages = {ENTRY_STAGE: enrollment['ProjectEntryID'], EXIT_STAGE: exited}
+    tables = {
+        'enrollment': enrollment.drop('folder', axis=1),
+        'exit': exit_table,
+        'disabilities': _make_disabilities(rng, stages, unknown_rate),
+        'employment_education': _make_stage_table(
+            rng, stages, {'Employed': [0, 1]}, unknown_rate),
+        'health_dv': _make_stage_table(
+            rng, stages, {'DomesticViolenceVictim': [0, 1],
+                          'GeneralHealthStatus': [1, 2, 3, 4, 5],
+                          'PregnancyStatus': [0, 1]}, unknown_rate),
+        'income': _make_income(rng, stages, unknown_rate)}
+
+    # Clients are exported in every folder they have an enrollment in, some
+    # with a conflicting second record
+    client_folders = enrollment[['PersonalID', 'folder']].drop_duplicates()
+    conflicts = _make_conflicts(rng, client, conflict_rate)
+    client = pd.concat([client, conflicts], ignore_index=True)
+    client_rows = client.merge(client_folders, on='PersonalID')
+
+    folder_rows = {'client': client_rows['folder'].values}
+    for name, df in tables.items():
+        folder_rows[name] = folder.loc[df['ProjectEntryID']].values
+    tables['client'] = client_rows.drop('folder', axis=1)
+
+    n_rows = {}
+    for path in paths:
+        os.makedirs(op.join(data_dir, path), exist_ok=True)
+    for name, df in tables.items():
+        n_rows[name] = _write_table(rng, df, folder_rows[name], data_dir,
+                                    paths, TABLE_FILES[name], duplicate_rate)
+    # every export has the full project table
+    for path in paths:
+        project.to_csv(op.join(data_dir, path, TABLE_FILES['project']),
+                       index=False)
+    n_rows['project'] = project.shape[0] * len(paths)
+    return n_rows
+
+
+def make_linkage_records(n_people=1000, duplicate_rate=0.3, typo_rate=0.1,
+                         seed=None):
+    """
+    Make person records to link, with some people recorded twice, with
+    typos, missing SSNs and DOBs that are off by a day.
+
+    Parameters
+    ----------
+    n_people : int
+        number of distinct people. Default is 1000.
+
+    duplicate_rate : float
+        fraction of people with a second record. Default is 0.3.
+
+    typo_rate : float
+        probability of a typo in each field of the second records.
+        Default is 0.1.
+
+    seed : int
+        seed of the random number generator. Default is None.
+
+    Returns
+    ----------
+    dataframe with fname, lname, ssn_as_str, dob and the true person id
+    (person) columns
+    """
+    rng = np.random.RandomState(seed)
+    people = pd.DataFrame({
+        'fname': rng.choice(FIRST_NAMES, n_people),
+        'lname': rng.choice(LAST_NAMES, n_people),
+        'ssn_as_str': _random_ssn(rng, n_people),
+        'dob': _random_dates(rng, n_people, '1930-01-01', '2015-12-31'),
+        'person': np.arange(n_people)})
+
+    copies = people.sample(frac=duplicate_rate, random_state=rng).copy()
+    for col in ['fname', 'lname', 'ssn_as_str']:
+        typo = rng.rand(copies.shape[0]) < typo_rate
+        copies.loc[typo, col] = [_typo(rng, value) for value
+                                 in copies.loc[typo, col]]
+    missing = rng.rand(copies.shape[0]) < typo_rate
+    copies.loc[missing, 'ssn_as_str'] = np.nan
+    shifted = rng.rand(copies.shape[0]) < typo_rate
+    copies.loc[shifted, 'dob'] += pd.Timedelta(days=1)
+
+    df = pd.concat([people, copies], ignore_index=True)
+    return df.sample(frac=1, random_state=rng).reset_index(drop=True)
+
+
+def _folder_year(path, default):
+    """Year of a folder named like 2016 (or default)."""
+    try:
+        return int(op.basename(path))
+    except ValueError:
+        return default + 2000
+
+
+def _random_dates(rng, n, start, end):
+    """Random days between two dates."""
+    start = pd.Timestamp(start)
+    n_days = (pd.Timestamp(end) - start).days
+    return start + pd.to_timedelta(rng.randint(0, n_days, n), unit='D')
+
+
+def _random_ssn(rng, n):
+    """Random 9 digit social security numbers as strings."""
+    return pd.Series(rng.randint(1, 10 ** 9, n)).astype(str).str.zfill(9)
+
+
+def _typo(rng, value):
+    """Replace a random character of a string."""
+    i = rng.randint(len(value))
+    return value[:i] + 'abcdefghijklmnopqrstuvwxyz'[rng.randint(26)] + \
+        value[i + 1:]
+
+
+def _codes(rng, values, n, unknown_rate):
+    """Random codes from values, with some unknown codes."""
+    codes = rng.choice(values, n)
+    unknown = rng.rand(n) < unknown_rate
+    codes[unknown] = rng.choice(CATEGORICAL_UNKNOWN, unknown.sum())
+    return codes
+
+
+def _make_client(rng, n_clients, unknown_rate):
+    client = pd.DataFrame({'PersonalID': np.arange(1, n_clients + 1)})
+    client['FirstName'] = rng.choice(FIRST_NAMES, n_clients)
+    client['LastName'] = rng.choice(LAST_NAMES, n_clients)
+    # some names that the name exclusion removes
+    excluded = rng.rand(n_clients) < 0.02
+    client.loc[excluded, 'FirstName'] = rng.choice(
+        NAME_EXCLUSION + ['A', 'client1'], excluded.sum())
+    client['SSN'] = _random_ssn(rng, n_clients)
+    client['DOB'] = _random_dates(rng, n_clients, '1930-01-01',
+                                  '2015-12-31').strftime('%Y-%m-%d')
+    for col in CLIENT_BOOLEAN:
+        p_true = 0.1 if col in CLIENT_BOOLEAN[7:] else 0.3
+        client[col] = _codes(rng, [0] * int(10 * (1 - p_true)) +
+                             [1] * int(10 * p_true), n_clients, unknown_rate)
+    client['Gender'] = _codes(rng, [0, 1, 2, 3, 4], n_clients, unknown_rate)
+    client['YearEnteredService'] = ''
+    client['YearSeparated'] = ''
+    client['MilitaryBranch'] = _codes(rng, [1, 2, 3, 4, 6], n_clients,
+                                      unknown_rate)
+    client['DischargeStatus'] = _codes(rng, [1, 2, 4, 5, 6, 7], n_clients,
+                                       unknown_rate)
+    client['DateCreated'] = '2016-01-01 00:00:00'
+    return client
+
+
+def _make_conflicts(rng, client, conflict_rate):
+    conflicts = client.sample(frac=conflict_rate, random_state=rng).copy()
+    dob = pd.to_datetime(conflicts['DOB'])
+    conflicts['DOB'] = (dob + pd.to_timedelta(rng.randint(1, 200,
+                                                          dob.shape[0]),
+                                              unit='D')).dt.strftime(
+        '%Y-%m-%d')
+    conflicts['White'] = 1 - conflicts['White'].clip(0, 1)
+    return conflicts
+
+
+def _make_households(rng, n_clients):
+    """Split people into households of 1 to 5 people."""
+    sizes = np.minimum(rng.geometric(0.6, n_clients), 5)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n_clients) + 1]
+    sizes[-1] -= sizes.sum() - n_clients
+    return np.repeat(np.arange(1, sizes.shape[0] + 1), sizes)
+
+
+def _make_enrollment(rng, households, enrollments_per_household, n_folders,
+                     first_year, unknown_rate):
+    """One enrollment of each person per household enrollment."""
+    n_households = households.max()
+    n_enroll = rng.poisson(enrollments_per_household - 1, n_households) + 1
+    # household enrollments, as (household, entry date)
+    hh_id = np.repeat(np.arange(1, n_households + 1), n_enroll)
+    entry = _random_dates(rng, hh_id.shape[0], '%d-01-01' % first_year,
+                          '%d-12-31' % (first_year + n_folders - 1))
+    hh_enroll = pd.DataFrame({'hh': hh_id, 'EntryDate': entry,
+                              'HouseholdID': np.arange(1, hh_id.shape[0] + 1)})
+    people = pd.DataFrame({'hh': households,
+                           'PersonalID': np.arange(1,
+                                                   households.shape[0] + 1)})
+    enrollment = hh_enroll.merge(people, on='hh').drop('hh', axis=1)
+    enrollment = enrollment.sort_values('EntryDate').reset_index(drop=True)
+
+    n = enrollment.shape[0]
+    enrollment['ProjectEntryID'] = np.arange(1, n + 1)
+    enrollment['folder'] = np.minimum(enrollment['EntryDate'].dt.year -
+                                      first_year, n_folders - 1)
+    enrollment['ResidencePrior'] = _codes(rng, [1, 2, 3, 12, 13, 16, 24],
+                                          n, unknown_rate)
+    enrollment['ResidencePriorLengthOfStay'] = _codes(rng, [2, 3, 4, 5, 10],
+                                                      n, unknown_rate)
+    enrollment['DateToStreetESSH'] = (enrollment['EntryDate'] -
+                                      pd.to_timedelta(rng.randint(0, 700, n),
+                                                      unit='D'))
+    for col in ['EntryDate', 'DateToStreetESSH']:
+        enrollment[col] = enrollment[col].dt.strftime('%Y-%m-%d')
+    enrollment['DateCreated'] = enrollment['EntryDate'] + ' 10:00:00'
+    return enrollment
+
+
+def _make_project(rng, n_projects):
+    return pd.DataFrame({
+        'ProjectID': np.arange(1, n_projects + 1),
+        'OrganizationID': rng.randint(1, max(2, n_projects // 3),
+                                      n_projects),
+        'ProjectName': ['Project %d' % i for i in range(1, n_projects + 1)],
+        'ProjectType': rng.choice(np.arange(1, 15), n_projects)})
+
+
+def _make_exit(rng, enrollment, unknown_rate):
+    """Exits of most enrollments."""
+    exited = enrollment[rng.rand(enrollment.shape[0]) < 0.85]
+    n = exited.shape[0]
+    destinations = pd.read_csv(op.join(op.dirname(__file__), 'data',
+                                       'metadata',
+                                       'destination_mappings.csv'))
+    destinations = destinations['DestinationNumeric'].unique()
+    destinations = destinations[~np.isin(destinations, CATEGORICAL_UNKNOWN)]
+    exit_date = pd.to_datetime(exited['EntryDate']) + pd.to_timedelta(
+        rng.exponential(60, n).astype(int), unit='D')
+    return pd.DataFrame({'ExitID': np.arange(1, n + 1),
+                         'ProjectEntryID': exited['ProjectEntryID'].values,
+                         'PersonalID': exited['PersonalID'].values,
+                         'ExitDate': exit_date.dt.strftime('%Y-%m-%d').values,
+                         'Destination': _codes(rng, destinations, n,
+                                               unknown_rate)})
+
+
+def _stage_rows(stages):
+    """ProjectEntryID & DataCollectionStage of entry and exit records."""
+    return pd.DataFrame({
+        'ProjectEntryID': np.concatenate([ids.values
+                                          for ids in stages.values()]),
+        'DataCollectionStage': np.concatenate([
+            np.full(ids.shape[0], stage) for stage, ids in stages.items()])})
+
+
+def _make_stage_table(rng, stages, columns, unknown_rate):
+    df = _stage_rows(stages)
+    for col, values in columns.items():
+        df[col] = _codes(rng, values, df.shape[0], unknown_rate)
+    return df
+
+
+def _make_disabilities(rng, stages, unknown_rate):
+    """One row per disability type at entry and exit."""
+    df = _stage_rows(stages)
+    types = np.arange(5, 11)
+    df = df.loc[df.index.repeat(types.shape[0])].reset_index(drop=True)
+    df['DisabilityType'] = np.tile(types, df.shape[0] // types.shape[0])
+    df['DisabilityResponse'] = _codes(rng, [0, 0, 0, 1], df.shape[0],
+                                      unknown_rate)
+    return df
+
+
+def _make_income(rng, stages, unknown_rate):
+    df = _stage_rows(stages)
+    n = df.shape[0]
+    total = np.zeros(n)
+    for col in INCOME_SOURCES:
+        df[col] = _codes(rng, [0, 0, 0, 1], n, 0)
+        amount = np.where(df[col] == 1, rng.gamma(2, 300, n).round(2), np.nan)
+        df[col + 'Amount'] = amount
+        total += np.nan_to_num(amount)
+    df['IncomeFromAnySource'] = _codes(rng, [0], n, unknown_rate)
+    df.loc[total > 0, 'IncomeFromAnySource'] = 1
+    df['TotalMonthlyIncome'] = total
+    for col in BENEFITS + INSURANCE:
+        df[col] = _codes(rng, [0, 0, 1], n, unknown_rate)
+    df['BenefitsFromAnySource'] = df[BENEFITS].eq(1).any(axis=1).astype(int)
+    df['InsuranceFromAnySource'] = df[INSURANCE].eq(1).any(axis=1).astype(int)
+    return df
+
+
+def _write_table(rng, df, folders, data_dir, paths, fname, duplicate_rate):
+    """
+    Write the rows of a table to the folder they belong to, with some rows
+    repeated in the next folder.
+    """
+    repeat = rng.rand(df.shape[0]) < duplicate_rate
+    df = pd.concat([df, df[repeat]], ignore_index=True)
+    folders = np.concatenate([folders, np.minimum(folders[repeat] + 1,
+                                                  len(paths) - 1)])
+    for i, path in enumerate(paths):
+        df[folders == i].to_csv(op.join(data_dir, path, fname), index=False)
+    return df.shape[0]
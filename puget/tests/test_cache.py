@@ -0,0 +1,50 @@
+"""Tests for functions in cache.py."""
+import puget.cache as pc
+import os
+import os.path as op
+import pandas as pd
+import pandas.util.testing as pdt
+import numpy as np
+import tempfile
+import pytest
+from numpy.testing import assert_equal
+
+
+def test_file_fingerprint():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = op.join(temp_dir, 'test.json')
+        with open(fname, 'w') as f:
+            f.write('{"name": "test"}')
+        fingerprint = pc.file_fingerprint(fname)
+        assert_equal(sorted(fingerprint.keys()), ['mtime_ns', 'size'])
+        fingerprint = pc.file_fingerprint(fname, hash_content=True)
+        assert 'sha256' in fingerprint
+
+        with open(fname, 'w') as f:
+            f.write('{"name": "test2"}')
+        assert pc.file_fingerprint(fname, hash_content=True) != fingerprint
+
+
+def test_cache_key():
+    key = pc.cache_key({'table': 'client', 'arguments': {'paths': ['2011']}})
+    assert_equal(key, pc.cache_key({'arguments': {'paths': ['2011']},
+                                    'table': 'client'}))
+    assert key != pc.cache_key({'table': 'client',
+                                'arguments': {'paths': ['2012']}})
+
+
+def test_read_write_cached():
+    pytest.importorskip('pyarrow')
+    df = pd.DataFrame({'id': [1, 2, 3],
+                       'time1': pd.to_datetime(['2001-01-13', None,
+                                                '2003-06-10']),
+                       'categ1': [0, np.nan, 1],
+                       'name': ['a', None, 'c']})
+    df.index = pd.Int64Index([0, 1, 3])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = pc.cache_path(op.join(temp_dir, 'cache'), 'test', 'abc123')
+        assert pc.read_cached(fname) is None
+        pc.write_cached(df, fname)
+        pdt.assert_frame_equal(pc.read_cached(fname), df)
+        # no temporary files are left behind
+        assert_equal(os.listdir(op.dirname(fname)), [op.basename(fname)])
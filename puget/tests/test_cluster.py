@@ -69,6 +69,24 @@ def test_cluster_by_groups():
                             true_df2_out.sort_index(axis=1))
 
 
+def test_groups_co_occurrence_shape():
+    # Individuals that are alone in their group (or have no group) are still
+    # rows & columns of the co-occurrence matrix:
+    df = pd.DataFrame({'individual_var': [1, 2, 2, 3, 4],
+                       'group_var': [10, 10, 10, 11, np.nan]})
+    true_T = np.array([[0, 1, 0, 0],
+                       [1, 0, 0, 0],
+                       [0, 0, 0, 0],
+                       [0, 0, 0, 0]])
+    T = cluster.groups_co_occurrence(df, 'individual_var', 'group_var',
+                                     sparse=True)
+    npt.assert_equal(T.shape, (4, 4))
+    npt.assert_equal(T.toarray(), true_T)
+    T = cluster.groups_co_occurrence(df, 'individual_var', 'group_var',
+                                     T=np.ones((4, 4)))
+    npt.assert_equal(T, true_T + 1)
+
+
 def test_cluster_by_time():
     df1 = pd.DataFrame({'individual_var': [1, 200, 3, 100, 1, 200, 3, 100],
                         'time_var1': pd.to_datetime(['2001-01-13',
@@ -91,6 +109,9 @@ def test_cluster_by_time():
     T = cluster.time_co_occurrence(df1, 'individual_var', ['time_var1'])
     true_T = np.array([[0, 1, 0, 0], [1, 0, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]])
     npt.assert_equal(T, true_T)
+    T = cluster.time_co_occurrence(df1, 'individual_var', ['time_var1'],
+                                   sparse=True)
+    npt.assert_equal(T.toarray(), true_T)
 
     # The first test-case uses only one time variable to establish linkage:
     df1_out = cluster.cluster(df1, 'individual_var', time_var=['time_var1'])
@@ -245,3 +266,76 @@ def test_cluster_w_nulls():
 
     pdt.assert_frame_equal(df1_out.sort_index(axis=1),
                            true_df1_out.sort_index(axis=1))
+
+
+def test_time_co_occurrence_delta():
+    # Times within time_delta co-occur, missing times don't co-occur with
+    # anything, and the index of the data-frame doesn't matter:
+    df = pd.DataFrame({'individual_var': [1, 2, 3, 4, 5],
+                       'time_var1': pd.to_datetime(['2001-01-13',
+                                                    '2001-01-15',
+                                                    '2001-01-19',
+                                                    np.nan, np.nan])},
+                      index=[10, 5, 3, 2, 1])
+    true_T = np.array([[0, 1, 0, 0, 0],
+                       [1, 0, 0, 0, 0],
+                       [0, 0, 0, 0, 0],
+                       [0, 0, 0, 0, 0],
+                       [0, 0, 0, 0, 0]])
+    for sparse in [True, False]:
+        T = cluster.time_co_occurrence(df, 'individual_var', ['time_var1'],
+                                       time_unit='D', time_delta=3,
+                                       sparse=sparse)
+        if sparse:
+            T = T.toarray()
+        npt.assert_equal(T, true_T)
+
+    df_out = cluster.cluster(df.copy(), 'individual_var',
+                             time_var=['time_var1'], time_unit='D',
+                             time_delta=4)
+    npt.assert_equal(df_out['cluster'].values, [1, 1, 1, 2, 3])
+
+
+def test_cluster_streaming():
+    # Streaming the edges gives the same clusters as the co-occurrence
+    # matrix, whatever the size of the chunks of edges:
+    rng = np.random.RandomState(0)
+    n = 200
+    df = pd.DataFrame({'individual_var': rng.randint(0, 80, n),
+                       'group_var': rng.randint(0, 120, n),
+                       'time_var1': pd.to_datetime('2001-01-01') +
+                       pd.to_timedelta(rng.randint(0, 2000, n), unit='D')})
+    df.loc[::7, 'time_var1'] = np.nan
+    for kwargs in [dict(group_var='group_var'),
+                   dict(time_var=['time_var1'], time_unit='D',
+                        time_delta=2),
+                   dict(group_var='group_var', time_var=['time_var1'],
+                        time_unit='D')]:
+        df_out = cluster.cluster(df.copy(), 'individual_var', **kwargs)
+        df_stream = cluster.cluster(df.copy(), 'individual_var',
+                                    streaming=True, **kwargs)
+        pdt.assert_frame_equal(df_out, df_stream)
+
+    mapping = cluster.make_mapping(df['individual_var'].unique())
+    true_labels = cluster.union_find_labels(
+        len(mapping), cluster.group_edges(df, 'individual_var',
+                                          'group_var', mapping))
+    labels = cluster.union_find_labels(
+        len(mapping), cluster.group_edges(df, 'individual_var',
+                                          'group_var', mapping,
+                                          chunk_size=3))
+    npt.assert_equal(labels, true_labels)
+
+
+def test_union_find_labels():
+    # The components don't depend on how the edges are chunked:
+    rng = np.random.RandomState(1)
+    first = rng.randint(0, 50, 40)
+    second = rng.randint(0, 50, 40)
+    true_labels = cluster.union_find_labels(50, [(first, second)])
+    labels = cluster.union_find_labels(
+        50, [(first[i:i + 1], second[i:i + 1]) for i in range(40)])
+    npt.assert_equal(labels, true_labels)
+    # numbered in the order of the first individual of each component
+    npt.assert_equal(cluster.union_find_labels(
+        5, [(np.array([4, 3]), np.array([0, 1]))]), [0, 1, 2, 1, 0])
@@ -0,0 +1,48 @@
+"""Tests for functions in instrument.py."""
+import puget.instrument as pi
+import puget.preprocess as pp
+import pandas as pd
+import tempfile
+from numpy.testing import assert_equal
+
+
+def test_stage():
+    # nothing is recorded without an active report
+    with pi.stage('outer') as record:
+        pi.set_shape(record, pd.DataFrame({'a': [1, 2]}))
+
+    records = []
+    with pi.StageReport(callback=records.append) as report:
+        with pi.stage('outer', table='client') as record:
+            with pi.stage('inner') as inner_record:
+                pi.set_shape(inner_record, pd.DataFrame({'a': [1, 2, 3]}))
+            pi.add_records([{'stage': 'other', 'parent': None,
+                             'table': 'exit'}])
+    assert_equal([r['stage'] for r in report.records],
+                 ['inner', 'other', 'outer'])
+    assert_equal([r['parent'] for r in report.records],
+                 ['outer', 'outer', None])
+    assert_equal(records, report.records)
+    assert_equal(report.records[0]['table'], 'client')
+    assert_equal(report.records[0]['n_rows'], 3)
+    assert_equal(report.records[0]['n_columns'], 1)
+    assert report.records[2]['wall_time'] >= report.records[0]['wall_time']
+    assert report.records[2]['cpu_time'] >= 0
+
+    df = report.to_frame()
+    assert_equal(list(df.columns), pi.RECORD_COLUMNS)
+    assert_equal(df.shape[0], 3)
+
+
+def test_read_table_stages():
+    temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
+    pd.DataFrame({'id': [1, 1, 2], 'code': [1, 8, 8]}).to_csv(temp_csv_file,
+                                                              index=False)
+    temp_csv_file.seek(0)
+    with pi.StageReport() as report:
+        pp.read_table({'2011': temp_csv_file.name}, categorical_var=['code'],
+                      duplicate_check_columns=['id'])
+    df = report.to_frame()
+    assert_equal(list(df['stage']), ['read', 'dedup', 'clean_columns'])
+    assert_equal(list(df['n_rows']), [3, 2, 2])
+    temp_csv_file.close()
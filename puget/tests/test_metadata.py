@@ -0,0 +1,56 @@
+"""Tests for functions in metadata.py."""
+import json
+import os
+import tempfile
+
+import pytest
+from numpy.testing import assert_equal
+
+import puget.metadata as pm
+import puget.preprocess as pp
+
+
+def test_get_schema():
+    schema = pm.get_schema(pp.METADATA_FILES['client'])
+    assert_equal(schema.name, 'client')
+    assert_equal(schema.person_ID, 'PersonalID')
+    assert_equal(schema.dob_column, 'DOB')
+    assert schema.program_ID is None
+    assert isinstance(schema.time_var, tuple)
+    assert_equal(schema.time_var, ('DOB', 'YearEnteredService',
+                                   'YearSeparated'))
+    # parsed only once
+    assert pm.get_schema(pp.METADATA_FILES['client']) is schema
+
+    # dicts are new copies, changing them doesn't change the schema
+    metadata = pp.get_metadata_dict(pp.METADATA_FILES['client'])
+    assert 'name' not in metadata
+    metadata.pop('person_ID')
+    metadata['time_var'].append('other')
+    assert_equal(pp.get_metadata_dict(pp.METADATA_FILES['client']),
+                 schema.to_dict())
+    assert_equal(schema['time_var'],
+                 ['DOB', 'YearEnteredService', 'YearSeparated'])
+
+
+def test_get_schema_changes():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = os.path.join(temp_dir, 'test.json')
+        with open(fname, 'w') as f:
+            json.dump({'name': 'test', 'person_ID': 'id'}, f)
+        assert_equal(pm.get_schema(fname).person_ID, 'id')
+
+        # the file is parsed again when it changes
+        with open(fname, 'w') as f:
+            json.dump({'name': 'test', 'person_ID': 'personal_id'}, f)
+        assert_equal(pm.get_schema(fname).person_ID, 'personal_id')
+
+        with open(fname, 'w') as f:
+            json.dump({'name': 'test', 'time_var': 'date'}, f)
+        with pytest.raises(ValueError):
+            pm.get_schema(fname)
+
+        with open(fname, 'w') as f:
+            json.dump({'person_ID': 'id'}, f)
+        with pytest.raises(ValueError):
+            pm.get_schema(fname)
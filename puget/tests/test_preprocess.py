@@ -10,6 +10,7 @@ import tempfile
 import json
 from numpy.testing import assert_equal
 import pytest
+from concurrent.futures import ProcessPoolExecutor
 
 
 def test_std_path_setup():
@@ -70,6 +71,14 @@ def test_read_table():
     df_test.index = pd.Int64Index([0, 1, 3])
     pdt.assert_frame_equal(df, df_test)
 
+    # test declaring dtypes, including for a column that isn't in the file
+    df = pp.read_table(file_spec, columns_to_drop=['drop1'],
+                       categorical_var=['categ1'], time_var=['time1'],
+                       duplicate_check_columns=['id', 'time1', 'categ1'],
+                       dtype={'categ1': 'Int8', 'other': 'category'})
+    df_test['categ1'] = pd.array([0, None, 0], dtype='Int8')
+    pdt.assert_frame_equal(df, df_test)
+
     # test passing a string filename with data_dir and path
     path, fname = op.split(temp_csv_file.name)
     path0, path1 = op.split(path)
@@ -78,6 +87,37 @@ def test_read_table():
                        time_var=['time1'],
                        duplicate_check_columns=['id', 'time1', 'categ1'])
 
+    # test recording the folder each row came from
+    temp_csv_file2 = tempfile.NamedTemporaryFile(mode='w')
+    df_init2 = pd.DataFrame({'id': [3], 'time1': ['2005-02-01'],
+                             'drop1': [1], 'ig_dedup1': [9], 'categ1': [0]})
+    df_init2.to_csv(temp_csv_file2, index=False)
+    temp_csv_file2.seek(0)
+    df = pp.read_table({'2011': temp_csv_file.name,
+                        '2012': temp_csv_file2.name},
+                       columns_to_drop=['drop1'], categorical_var=['categ1'],
+                       time_var=['time1'],
+                       duplicate_check_columns=['id', 'time1', 'categ1'],
+                       source_column='folder')
+    assert_equal(df.shape[0], 4)
+    assert_equal(list(df.loc[df['id'] == 3, 'folder']), ['2012'])
+    assert_equal(set(df.loc[df['id'] != 3, 'folder']), {'2011'})
+
+    # reading the folders concurrently gives the same table
+    with ProcessPoolExecutor(2) as executor:
+        for kwargs in [{'n_jobs': 2}, {'executor': executor}]:
+            df_parallel = pp.read_table({'2011': temp_csv_file.name,
+                                         '2012': temp_csv_file2.name},
+                                        columns_to_drop=['drop1'],
+                                        categorical_var=['categ1'],
+                                        time_var=['time1'],
+                                        duplicate_check_columns=['id',
+                                                                 'time1',
+                                                                 'categ1'],
+                                        source_column='folder', **kwargs)
+            pdt.assert_frame_equal(df_parallel, df)
+    temp_csv_file2.close()
+
     temp_csv_file.close()
 
     # test error checking
@@ -90,6 +130,194 @@ def test_read_table():
         pp.read_table('test', data_dir=None, paths=None)
 
 
+def test_read_table_codes_and_years():
+    temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
+    df_init = pd.DataFrame({'id': [1, 2, 3],
+                            'ResidencePrior': [101, 1, 99],
+                            'year': [1970, 1980, np.NaN],
+                            'date': ['2010-01-01', '2011-02-03', 'bad']})
+    df_init.to_csv(temp_csv_file, index=False)
+    temp_csv_file.seek(0)
+
+    # 3 digit codes fit in the dtype of the packaged metadata
+    dtype = pp.get_metadata_dict(pp.METADATA_FILES['enrollment'])['dtype']
+    df = pp.read_table({2011: temp_csv_file.name}, data_dir=None, paths=None,
+                       categorical_var=['ResidencePrior'],
+                       time_var=['year', 'date'], dtype=dtype)
+    pdt.assert_series_equal(df['ResidencePrior'],
+                            pd.Series([101, 1, np.NaN], name='ResidencePrior',
+                                      dtype='Int16'))
+    # time_var columns without a format are converted as they are read
+    pdt.assert_series_equal(df['year'],
+                            pd.to_datetime(df_init['year'], errors='coerce'))
+    pdt.assert_series_equal(df['date'],
+                            pd.to_datetime(df_init['date'], errors='coerce'))
+    temp_csv_file.close()
+
+
+def test_stream_table():
+    pytest.importorskip('pyarrow')
+    temp_csv_file1 = tempfile.NamedTemporaryFile(mode='w')
+    temp_csv_file2 = tempfile.NamedTemporaryFile(mode='w')
+    df1 = pd.DataFrame({'id': [1, 2, 3, 4, 5],
+                        'time1': ['2001-01-13', '2004-05-10', '2005-05-10',
+                                  '2003-04-21', 'bad'],
+                        'code': [1, 8, 2, 99, 3],
+                        'drop': ['a', 'b', 'c', 'd', 'e']})
+    df2 = pd.DataFrame({'id': [5, 6, 2, 7],
+                        'time1': ['2009-03-14', '2011-06-12', '2004-05-10',
+                                  '2012-01-02'],
+                        'code': [9, 4, 8, 1],
+                        'drop': ['f', 'g', 'h', 'i']})
+    df1.to_csv(temp_csv_file1, index=False)
+    df2.to_csv(temp_csv_file2, index=False)
+    temp_csv_file1.seek(0)
+    temp_csv_file2.seek(0)
+    file_spec = {2011: temp_csv_file1.name, 2012: temp_csv_file2.name}
+
+    kwargs = dict(columns_to_drop=['drop'], categorical_var=['code'],
+                  time_var=['time1'], duplicate_check_columns=['id'],
+                  source_column='year')
+    df_test = pp.read_table(file_spec, **kwargs).reset_index(drop=True)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_file = op.join(out_dir, 'table.parquet')
+        assert_equal(pp.stream_table(file_spec, out_file, chunksize=2,
+                                     **kwargs), out_file)
+        df = pd.read_parquet(out_file)
+        assert_equal(os.listdir(out_dir), ['table.parquet'])
+
+    pdt.assert_frame_equal(df, df_test, check_dtype=False)
+    assert_equal(df['time1'].dtype, df_test['time1'].dtype)
+
+    temp_csv_file1.close()
+    temp_csv_file2.close()
+
+
+def test_stream_table_dedup():
+    pytest.importorskip('pyarrow')
+    temp_csv_file1 = tempfile.NamedTemporaryFile(mode='w')
+    temp_csv_file2 = tempfile.NamedTemporaryFile(mode='w')
+    # The same ids are written as integers and floats, and some are missing
+    temp_csv_file1.write('id,site,value\n1,a,1\n2,a,2\n,b,3\n3,b,4\n'
+                         '1.0,a,5\n,b,6\n')
+    temp_csv_file2.write('id,site,value\n2.0,a,7\n3,c,8\n1,a,9\n'
+                         '4,,10\n4,,11\n')
+    temp_csv_file1.seek(0)
+    temp_csv_file2.seek(0)
+    file_spec = {2011: temp_csv_file1.name, 2012: temp_csv_file2.name}
+
+    kwargs = dict(duplicate_check_columns=['id', 'site'])
+    df_test = pp.read_table(file_spec, **kwargs).reset_index(drop=True)
+    assert_equal(df_test['value'].tolist(), [8, 11, 2, 4, 5, 6])
+
+    for chunksize in [1, 2, 4, 100]:
+        with tempfile.TemporaryDirectory() as out_dir:
+            out_file = op.join(out_dir, 'table.parquet')
+            pp.stream_table(file_spec, out_file, chunksize=chunksize,
+                            **kwargs)
+            df = pd.read_parquet(out_file)
+        # stream_table writes the rows in the order of the files
+        df = df.sort_values('value').reset_index(drop=True)
+        df_sorted = df_test.sort_values('value').reset_index(drop=True)
+        pdt.assert_frame_equal(df, df_sorted, check_dtype=False)
+
+    temp_csv_file1.close()
+    temp_csv_file2.close()
+
+
+def test_duplicate_rows():
+    temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
+    rng = np.random.RandomState(0)
+    df_test = pd.DataFrame({'id': rng.randint(0, 20, 200),
+                            'name': rng.choice(['a', 'b', 'c,d'], 200),
+                            'value': np.arange(200)})
+    df_test.to_csv(temp_csv_file, index=False)
+    temp_csv_file.seek(0)
+
+    expected = np.where(df_test.duplicated(['id', 'name'], keep='last'))[0]
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Small buckets, so that the rows are spread over many of them
+        drop_files = pp._duplicate_rows([(2011, temp_csv_file.name)],
+                                        ['id', 'name'], work_dir,
+                                        chunksize=30, bucket_bytes=100)
+        assert len(drop_files) > 10
+        drop = np.sort(np.concatenate([np.load(f) for f in drop_files]))
+    assert_equal(drop, expected)
+
+    temp_csv_file.close()
+
+
+def test_mask_categorical_unknown():
+    df = pd.DataFrame({'a': [1, 8, 2], 'b': [1, 2, 3],
+                       'c': pd.array([9, 1, None], dtype='Int8'),
+                       'd': [1.5, 99., 2.]})
+    df_test = pd.DataFrame({'a': [1, np.NaN, 2], 'b': [1, 2, 3],
+                            'c': pd.array([None, 1, None], dtype='Int8'),
+                            'd': [1.5, np.NaN, 2.]})
+    pdt.assert_frame_equal(pp.mask_categorical_unknown(df.copy(),
+                                                       ['a', 'b', 'c', 'd']),
+                           df_test)
+
+    # any number of unknown values, with nullable integers
+    df_test = pd.DataFrame({'a': pd.array([None, 8, None], dtype='Int64'),
+                            'b': pd.array([None, None, 3], dtype='Int64'),
+                            'c': pd.array([9, None, None], dtype='Int8'),
+                            'd': [1.5, 99., np.NaN]})
+    pdt.assert_frame_equal(pp.mask_categorical_unknown(df.copy(),
+                                                       ['a', 'b', 'c', 'd'],
+                                                       [1, 2],
+                                                       nullable_int=True),
+                           df_test)
+
+
+def test_parse_time():
+    values = pd.Series(['2001-01-13', np.NaN, '05/21/2004', 'bad',
+                        '2001-01-13'], index=[3, 4, 5, 6, 7], name='time1')
+    df_test = pd.Series(pd.to_datetime(['2001-01-13', pd.NaT, pd.NaT, pd.NaT,
+                                        '2001-01-13']),
+                        index=[3, 4, 5, 6, 7], name='time1')
+    pdt.assert_series_equal(pp.parse_time(values, '%Y-%m-%d'), df_test)
+
+    df_test_formats = df_test.copy()
+    df_test_formats[5] = pd.Timestamp('2004-05-21')
+    pdt.assert_series_equal(pp.parse_time(values, ['%Y-%m-%d', '%m/%d/%Y']),
+                            df_test_formats)
+
+    # the number of unparseable values is reported by read_table
+    temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
+    values.to_frame().to_csv(temp_csv_file, index=False)
+    temp_csv_file.seek(0)
+    with pytest.warns(UserWarning, match='2 values of time1'):
+        df = pp.read_table({'2011': temp_csv_file.name}, time_var=['time1'],
+                           time_format={'time1': '%Y-%m-%d'}, dedup=False)
+    assert_equal(df['time1'].values, df_test.values)
+    temp_csv_file.close()
+
+
+def test_split_rows_to_columns():
+    df = pd.DataFrame({'id': [11, 11, 11, 12, 13],
+                       'stage': [0, 0, 1, 0, 1],
+                       'value': [1, 2, 3, 4, 5]})
+    df_wide = pp.split_rows_to_columns(df, 'stage', {0: '_entry', 1: '_exit'},
+                                       'id')
+
+    # the single exit row of id 11 is paired with both entry rows
+    df_test = pd.DataFrame({'id': [11, 11, 12, 13],
+                            'value_entry': [1, 2, 4, np.NaN],
+                            'value_exit': [3, 3, np.NaN, 5]})
+    pdt.assert_frame_equal(df_wide, df_test)
+
+    # merge columns keep their place among the columns of the first category
+    df_wide = pp.split_rows_to_columns(df[['value', 'id', 'stage']], 'stage',
+                                       {0: '_entry', 1: '_exit'}, 'id')
+    assert_equal(list(df_wide.columns), ['value_entry', 'id', 'value_exit'])
+
+    with pytest.raises(TypeError):
+        pp.split_rows_to_columns(df, ['stage'], {0: '_entry', 1: '_exit'},
+                                 'id')
+
+
 def test_read_entry_exit():
     temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
     df_init = pd.DataFrame({'id': [11, 11, 12],
@@ -320,8 +548,8 @@ def test_get_client():
     for name_exclusion in [False, True]:
         # get path & filenames
         df = pp.get_client(file_spec=file_spec, data_dir=None, paths=None,
-                        metadata_file=temp_meta_file.name,
-                        name_exclusion=name_exclusion)
+                           metadata_file=temp_meta_file.name,
+                           name_exclusion=name_exclusion)
 
         df_test = pd.DataFrame({'id': [11, 11, 12, 13, 14, 15, 15, 16, 16, 17, 17,
                                     18],
@@ -362,6 +590,19 @@ def test_get_client():
         print(df_test.dtypes)
         pdt.assert_frame_equal(df, df_test)
 
+    # name columns declared as categories are excluded the same way
+    temp_meta_file3 = tempfile.NamedTemporaryFile(mode='w')
+    metadata['dtype'] = {'first_name': 'category'}
+    temp_meta_file3.file.write(json.dumps(metadata))
+    temp_meta_file3.seek(0)
+    df = pp.get_client(file_spec=file_spec, data_dir=None, paths=None,
+                       metadata_file=temp_meta_file3.name,
+                       name_exclusion=True)
+    assert df['first_name'].dtype.name == 'category'
+    assert_equal(sorted(df['id'].unique()),
+                 [11, 12, 13, 14, 15, 16, 18])
+    temp_meta_file3.close()
+
     # test error checking
     temp_meta_file2 = tempfile.NamedTemporaryFile(mode='w')
     metadata = ({'name': 'test',
@@ -384,6 +625,17 @@ def test_get_client():
     temp_meta_file.close()
 
 
+def test_keep_by_name():
+    df = pd.DataFrame({'first_name': ['AAA', 'No.Name', 'B.', 'CC3',
+                                      np.nan, 'DDD', 'EEE', 12],
+                       'last_name': ['ZZZ', 'YYY', 'XXX', 'WWW', 'VVV',
+                                     'REFUSED', None, 'UUU']},
+                      index=[3, 1, 4, 1, 5, 9, 2, 6])
+    keep = pp._keep_by_name(df, ['first_name', 'last_name'])
+    pdt.assert_series_equal(keep, pd.Series([True] + [False] * 7,
+                                            index=df.index))
+
+
 def test_get_disabilities():
     temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
     df_init = pd.DataFrame({'pid': [11, 11, 11, 11, 12, 12, 12, 12],
@@ -422,6 +674,11 @@ def test_get_disabilities():
                             'Developmental_entry': [1.0, 0.0],
                             'Developmental_exit': [1.0, 1.0]})
 
+    # the first entry & exit types come first, then the other types
+    assert_equal(list(df.columns), ['pid', 'Physical_entry', 'Physical_exit',
+                                    'Developmental_entry',
+                                    'Developmental_exit'])
+
     # sort because column order is not assured because started with dicts
     df = df.sort_index(axis=1)
     df_test = df_test.sort_index(axis=1)
@@ -617,6 +874,54 @@ def test_get_project():
     pdt.assert_frame_equal(df, df_test)
 
 
+def test_get_table():
+    pytest.importorskip('pyarrow')
+    temp_csv_file = tempfile.NamedTemporaryFile(mode='w')
+    df_init = pd.DataFrame({'pid': [3, 4], 'name': ['shelter1', 'rrh2'],
+                            'ProjectType': [1, 13]})
+    df_init.to_csv(temp_csv_file, index=False)
+    temp_csv_file.seek(0)
+
+    temp_meta_file = tempfile.NamedTemporaryFile(mode='w')
+    metadata = {'name': 'test', 'program_ID': 'pid',
+                'duplicate_check_columns': ['pid', 'name', 'ProjectType'],
+                'columns_to_drop': [],
+                'project_type_column': 'ProjectType'}
+    temp_meta_file.file.write(json.dumps(metadata))
+    temp_meta_file.seek(0)
+
+    file_spec = {2011: temp_csv_file.name}
+    df_test = pp.get_project(file_spec=file_spec,
+                             metadata_file=temp_meta_file.name)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # without a cache_dir, this just calls the get_* function
+        df = pp.get_table('project', file_spec=file_spec,
+                          metadata_file=temp_meta_file.name)
+        pdt.assert_frame_equal(df, df_test)
+        assert_equal(os.listdir(cache_dir), [])
+
+        for i in range(2):
+            df = pp.get_table('project', cache_dir=cache_dir,
+                              file_spec=file_spec,
+                              metadata_file=temp_meta_file.name)
+            pdt.assert_frame_equal(df, df_test)
+            assert_equal(len(os.listdir(cache_dir)), 1)
+
+        # changing the metadata gives a new cache entry
+        metadata['columns_to_drop'] = ['name']
+        metadata['duplicate_check_columns'] = ['pid', 'ProjectType']
+        with open(temp_meta_file.name, 'w') as outfile:
+            json.dump(metadata, outfile)
+        df = pp.get_table('project', cache_dir=cache_dir, file_spec=file_spec,
+                          metadata_file=temp_meta_file.name)
+        assert 'name' not in df.columns
+        assert_equal(len(os.listdir(cache_dir)), 2)
+
+    temp_csv_file.close()
+    temp_meta_file.close()
+
+
 def test_merge():
     with tempfile.TemporaryDirectory() as temp_dir:
         year_str = '2011'
@@ -854,4 +1159,68 @@ def test_merge():
             # sort because column order is not assured because started with dicts
             df = df.sort_index(axis=1)
             df_test = df_test.sort_index(axis=1)
-            pdt.assert_frame_equal(df, df_test)
\ No newline at end of file
+            pdt.assert_frame_equal(df, df_test)
+            # running the table stages concurrently gives the same result
+            with puget.instrument.StageReport() as report:
+                df_parallel = pp.merge_tables(meta_files=metadata_files,
+                                              data_dir=temp_dir, paths=paths,
+                                              groups=False,
+                                              name_exclusion=name_exclusion,
+                                              n_jobs=2)
+            pdt.assert_frame_equal(df_parallel.sort_index(axis=1), df)
+            # and records the stages done in the worker processes
+            stages = report.to_frame()
+            assert_equal(set(stages.loc[stages['stage'] == 'clean', 'table']),
+                         set(metadata_files))
+            merges = stages[stages['stage'] == 'merge']
+            assert_equal(merges.shape[0], 7)
+            assert_equal(merges['n_rows'].iloc[-1], df.shape[0])
+
+        # incremental merges only clean the rows of the new folder's ids again
+        pytest.importorskip('pyarrow')
+        dir_year = op.join(temp_dir, '2012')
+        os.makedirs(dir_year, exist_ok=True)
+        pd.DataFrame({'personID': [5], 'person_enrollID': [50],
+                      'programID': [200], 'groupID': [5000],
+                      'entrydate': ['2012-02-03']}).to_csv(
+            op.join(dir_year, 'Enrollment.csv'), index=False)
+        pd.DataFrame({'ppid': [50], 'dest_num': [12],
+                      'exitdate': ['2012-05-01']}).to_csv(
+            op.join(dir_year, 'Exit.csv'), index=False)
+        pd.DataFrame({'pid': [4, 5], 'dob': ['1983-04-10', '1975-10-02'],
+                      'gender': [0, 1], 'veteran': [0, 0],
+                      'first_name': ["DDD", "EEE"]}).to_csv(
+            op.join(dir_year, 'Client.csv'), index=False)
+        pd.DataFrame({'person_enrollID': [50, 50], 'stage': [0, 1],
+                      'type': [5, 5], 'response': [1, 1]}).to_csv(
+            op.join(dir_year, 'Disabilities.csv'), index=False)
+        for fname, col in [('EmploymentEducation.csv', 'employed'),
+                           ('HealthAndDV.csv', 'health_status'),
+                           ('IncomeBenefits.csv', 'income')]:
+            pd.DataFrame({'ppid': [50, 50], 'stage': [0, 1],
+                          col: [0, 1]}).to_csv(op.join(dir_year, fname),
+                                               index=False)
+        project_df.to_csv(op.join(dir_year, 'Project.csv'), index=False)
+
+        incremental_dir = op.join(temp_dir, 'incremental')
+        os.makedirs(incremental_dir)
+        for paths in [['2011'], ['2011', '2012'], ['2011', '2012']]:
+            df = pp.merge_tables(meta_files=metadata_files, data_dir=temp_dir,
+                                 paths=paths, groups=False,
+                                 incremental_dir=incremental_dir)
+            df_test = pp.merge_tables(meta_files=metadata_files,
+                                      data_dir=temp_dir, paths=paths,
+                                      groups=False)
+            df = df.sort_values('person_enrollID').reset_index(drop=True)
+            df_test = df_test.sort_values('person_enrollID').reset_index(
+                drop=True)
+            pdt.assert_frame_equal(df.sort_index(axis=1),
+                                   df_test.sort_index(axis=1),
+                                   check_dtype=False)
+        assert_equal(df.loc[df['personID'] == 4, 'dob'].values,
+                     pd.to_datetime(['1983-04-07']).values)
+        with open(op.join(incremental_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        assert_equal([folder['path'] for folder
+                      in manifest['tables']['client']['folders']],
+                     ['2011', '2012'])
@@ -1,6 +1,9 @@
 import numpy as np
 import pandas as pd
 import pandas.util.testing as pdt
+import numpy.testing as npt
+import recordlinkage as rl
+import puget.recordlinkage as prl
 from puget.recordlinkage import link_records
 
 def test_linkage():
@@ -166,3 +169,48 @@ def test_linkage():
     test_df = prelink_ids.copy()
     test_df["linkage_PID"] = [1, 1, 1]
     pdt.assert_frame_equal(test_df, linked)
+
+
+def test_block_pairs():
+    df = pd.DataFrame({'lname': ['A', 'B', 'A', np.nan, 'A', 'B', 'C']},
+                      index=[10, 11, 12, 13, 14, 15, 16])
+    indexer = rl.Index()
+    indexer.block('lname')
+    true_pairs = sorted(indexer.index(df).tolist())
+    for shard_size in [1, 2, 100]:
+        shards = list(prl.block_pairs(df, 'lname', shard_size=shard_size))
+        pairs = [(df.index[i], df.index[j]) for later, earlier in shards
+                 for i, j in zip(later, earlier)]
+        npt.assert_equal(sorted(pairs), true_pairs)
+        assert all(len(later) <= max(shard_size, 2)
+                   for later, earlier in shards)
+
+
+def test_block_and_match_shards():
+    prelink_ids = pd.DataFrame(data={'ssn_as_str': ['123456789', '123456789',
+                                                    '246801357', '123456789',
+                                                    np.nan],
+                                     'lname': ["QWERT", "QWERT", "ASDF",
+                                               "QWERT", "QWERT"],
+                                     'fname': ["QWERT", "QEWRT", "ASDF",
+                                               "ZXCV", "QWERT"],
+                                     'dob': pd.to_datetime(
+                                         ["1990-02-01", "1990-02-01",
+                                          "1977-03-04", "1981-05-06",
+                                          "1990-02-01"])})
+    comparison_dict = {"fname": "string", "ssn_as_str": "string",
+                       "dob": "date"}
+    features = prl.block_and_match(prelink_ids, 'lname', comparison_dict)
+    assert features.shape == (6, 5)
+    for shard_size, n_jobs in [(1, 1), (2, 2)]:
+        shard_features = prl.block_and_match(prelink_ids, 'lname',
+                                             comparison_dict,
+                                             shard_size=shard_size,
+                                             n_jobs=n_jobs)
+        pdt.assert_frame_equal(features.sort_index(),
+                               shard_features.sort_index())
+    linked = link_records(prelink_ids.copy(),
+                          [{'block_variable': 'lname',
+                            'match_variables': comparison_dict}],
+                          shard_size=1, n_jobs=2)
+    npt.assert_equal(linked['linkage_PID'].values, [1, 1, 2, 3, 1])
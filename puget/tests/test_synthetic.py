@@ -0,0 +1,46 @@
+"""Tests for functions in synthetic.py."""
+import puget.preprocess as pp
+import puget.synthetic as ps
+import os
+import os.path as op
+import pandas as pd
+import tempfile
+from numpy.testing import assert_equal
+
+
+def test_make_county():
+    paths = ['2015', '2016']
+    with tempfile.TemporaryDirectory() as data_dir:
+        n_rows = ps.make_county(data_dir, paths=paths, n_clients=200, seed=1)
+        assert_equal(set(n_rows), set(pp.TABLE_FILES))
+        for path in paths:
+            assert_equal(set(os.listdir(op.join(data_dir, path))),
+                         set(pp.TABLE_FILES.values()))
+        client = pd.concat([pd.read_csv(op.join(data_dir, path,
+                                                'Client.csv'))
+                            for path in paths])
+        assert_equal(client.shape[0], n_rows['client'])
+        assert_equal(client['PersonalID'].nunique(), 200)
+        # people are exported several times
+        assert client.duplicated('PersonalID').any()
+
+        # the tables can be cleaned & merged with the packaged metadata
+        df = pp.merge_tables(data_dir=data_dir, paths=paths, groups=False)
+        assert_equal(df['PersonalID'].nunique(), 200)
+        assert not df['ProjectEntryID'].duplicated().any()
+
+        # and the same seed gives the same tables
+        with tempfile.TemporaryDirectory() as data_dir2:
+            ps.make_county(data_dir2, paths=paths, n_clients=200, seed=1)
+            for fname in pp.TABLE_FILES.values():
+                with open(op.join(data_dir, '2016', fname)) as f1, \
+                        open(op.join(data_dir2, '2016', fname)) as f2:
+                    assert f1.read() == f2.read()
+
+
+def test_make_linkage_records():
+    df = ps.make_linkage_records(100, duplicate_rate=0.5, seed=0)
+    assert_equal(df.shape[0], 150)
+    assert_equal(df['person'].nunique(), 100)
+    assert_equal(list(df.columns), ['fname', 'lname', 'ssn_as_str', 'dob',
+                                    'person'])
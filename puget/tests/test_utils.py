@@ -1,6 +1,9 @@
 import puget.utils as pu
 import puget
+import os
 import os.path as op
+import numpy as np
+import numpy.testing as npt
 import pandas as pd
 import pandas.util.testing as pdt
 import tempfile
@@ -44,3 +47,68 @@ def test_merge_destination():
     pdt.assert_frame_equal(df_merge, df_test)
 
     TF.close()
+
+
+def test_merge_destination_mapping_changes():
+    """The mapping file is read again when it changes."""
+    with tempfile.TemporaryDirectory() as path:
+        fname = op.join(path, 'mappings.csv')
+        mapping = pd.DataFrame({'Standard': ['New Standards'] * 2,
+                                'DestinationNumeric': [1, 2],
+                                'DestinationDescription': ['Home', 'Street'],
+                                'DestinationGroup': ['Permanent', 'Other'],
+                                'DestinationSuccess': ['Successful Exit',
+                                                       'Other Exit'],
+                                'Subsidy': ['No', 'No']})
+        mapping.to_csv(fname, index=False)
+        df = pd.DataFrame({'numeric': [2, 3, 1]}, index=[5, 6, 7])
+        df_merge = pu.merge_destination(df, df_destination_column='numeric',
+                                        destination_map_fname='mappings.csv',
+                                        directory=path)
+        pdt.assert_series_equal(df_merge['DestinationDescription'],
+                                pd.Series(['Street', None, 'Home'],
+                                          name='DestinationDescription'))
+
+        mapping['DestinationDescription'] = ['House', 'Car']
+        mapping.to_csv(fname, index=False)
+        os.utime(fname, ns=(0, 0))
+        df_merge = pu.merge_destination(df, df_destination_column='numeric',
+                                        destination_map_fname='mappings.csv',
+                                        directory=path)
+        pdt.assert_series_equal(df_merge['DestinationDescription'],
+                                pd.Series(['Car', None, 'House'],
+                                          name='DestinationDescription'))
+
+
+def test_clean_ssns():
+    ssns = pd.Series([11111111, 123456789, np.nan, 0, 999999999, 12345,
+                      88888888, 99999999], index=list('abcdefgh'))
+    # same as the scalar version
+    pdt.assert_series_equal(pu.clean_ssns(ssns, same_digit=False),
+                            ssns.apply(pu.clean_ssn))
+    pdt.assert_series_equal(pu.clean_ssns(ssns),
+                            pd.Series([np.nan, 123456789, np.nan, np.nan,
+                                       np.nan, 12345, np.nan, 99999999],
+                                      index=list('abcdefgh')))
+
+    pdt.assert_series_equal(pu.stringify_ssns(pu.clean_ssns(ssns)),
+                            pd.Series([None, '123456789', None, None, None,
+                                       '000012345', None, '099999999'],
+                                      index=list('abcdefgh')))
+    npt.assert_equal(pu.stringify_ssns(np.array([1.0, 2.0])).tolist(),
+                     ['000000001', '000000002'])
+
+
+def test_stringify_ssns_edge_values():
+    """Values that are not SSNs are None instead of wrapped or truncated."""
+    ssns = pd.Series([-5, 1234567890, 12.5, 1e9, 0, 999999999, 123, np.nan])
+    ssns_str = pu.stringify_ssns(ssns)
+    valid = [False, False, False, False, True, True, True, False]
+    for ssn, ssn_str, is_valid in zip(ssns, ssns_str, valid):
+        if is_valid:
+            # the scalar version, zero-padded
+            npt.assert_equal(ssn_str, pu.stringify_ssn(ssn).zfill(9))
+        else:
+            assert ssn_str is None
+    npt.assert_equal([pu.stringify_ssn(ssn) for ssn in ssns[:2]],
+                     ['-5', '1234567890'])
@@ -1,10 +1,19 @@
 import pandas as pd
+import os
 import os.path as op
 import numpy as np
 from puget.data import DATA_PATH
 
 METADATA = op.join(DATA_PATH, 'metadata')
 
+# Placeholder SSNs: 11111111, 22222222, ..., 88888888
+NULL_SSNS = [11111111 * i for i in range(1, 9)]
+# 9 digit SSNs that repeat a single digit: 000000000, ..., 999999999
+SAME_DIGIT_SSNS = [111111111 * i for i in range(10)]
+
+# Prepared destination mappings, by file: (mtime, mapping table, index)
+_destination_mappings = {}
+
 
 def merge_destination(df, df_destination_column='destination_value',
                       destination_map_fname='destination_mappings.csv',
@@ -40,24 +49,59 @@ def merge_destination(df, df_destination_column='destination_value',
             with & without subsidy, unsuccessful
         Subsidy
     """
+    mapping_table, mapping_index = _destination_mapping(
+        destination_map_fname, directory)
+
+    if not mapping_index.is_unique:
+        # Destinations with several mappings repeat the rows of df
+        output_df = pd.merge(left=df, right=mapping_table, how='left',
+                             left_on=df_destination_column,
+                             right_on='DestinationNumeric')
+        return output_df.drop(df_destination_column, axis=1)
+
+    # Look up the row of the mapping of each destination (-1 for
+    # destinations that are not in the mapping, which get NaNs)
+    positions = mapping_index.get_indexer(df[df_destination_column])
+    mapped = mapping_table.reindex(positions).reset_index(drop=True)
+    output_df = pd.concat([df.drop(df_destination_column,
+                                   axis=1).reset_index(drop=True),
+                           mapped], axis=1)
+
+    return output_df
+
+
+def _destination_mapping(destination_map_fname, directory):
+    """
+    Read a destination mapping file, keeping the "New Standards" rows with
+    Subsidy recoded to boolean.
+
+    The prepared table is kept in memory until the file changes.
+
+    Returns
+    -------
+    mapping_table: dataframe with the mappings, indexed from 0
+
+    mapping_index: Index of the DestinationNumeric column
+    """
+    fname = op.abspath(op.join(directory, destination_map_fname))
+    mtime = os.stat(fname).st_mtime_ns
+    cached = _destination_mappings.get(fname)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+
     # Import the csv file into pandas:
-    mapping_table = pd.read_csv(op.join(directory, destination_map_fname))
+    mapping_table = pd.read_csv(fname)
     mapping_table = mapping_table[mapping_table.Standard == "New Standards"]
     # Recode Subsidy column to boolean
     mapping_table['Subsidy'] = mapping_table['Subsidy'].map({'Yes': True,
                                                              'No': False})
     # Drop columns we don't need
     mapping_table = mapping_table.drop(['Standard'], axis=1)
+    mapping_table = mapping_table.reset_index(drop=True)
+    mapping_index = pd.Index(mapping_table['DestinationNumeric'])
 
-    # Merge the Destination mapping with the df
-    # based on the last_destination string
-    output_df = pd.merge(left=df, right=mapping_table, how='left',
-                         left_on=df_destination_column,
-                         right_on='DestinationNumeric')
-
-    output_df = output_df.drop(df_destination_column, axis=1)
-
-    return output_df
+    _destination_mappings[fname] = (mtime, mapping_table, mapping_index)
+    return mapping_table, mapping_index
 
 
 def update_progress(progress):
@@ -77,8 +121,7 @@ def clean_ssn(ssn):
     Clean up corner cases for SSN values
     """
     # First case, SSN is 11111111, 22222222, etc.:
-    nulls = [11111111 * i for i in range(1, 9)]
-    if ssn in nulls:
+    if ssn in NULL_SSNS:
         return np.nan
     # There might be some other conditions here.
     else:
@@ -94,3 +137,55 @@ def stringify_ssn(ssn):
     else:
         ssn_str = str(int(ssn))
         return ssn_str
+
+
+def clean_ssns(ssns, same_digit=True):
+    """
+    Clean up corner cases for a column of SSN values (see clean_ssn).
+
+    Parameters
+    -----------
+    ssns: a Series or array of numeric SSNs (strings of digits are converted,
+        other strings become NaN)
+
+    same_digit: boolean (optional). Whether to also set 9 digit SSNs that are
+        the same digit repeated (000000000, 111111111, etc.) to NaN, as in
+        HILD_merge.R. Default is True.
+
+    Returns
+    -------
+    A float Series with NaN for missing and placeholder SSNs
+    """
+    ssns = pd.to_numeric(pd.Series(ssns), errors='coerce').astype(float)
+    nulls = np.isin(ssns.values, NULL_SSNS)
+    if same_digit:
+        nulls |= np.isin(ssns.values, SAME_DIGIT_SSNS)
+    return ssns.mask(nulls)
+
+
+def stringify_ssns(ssns):
+    """
+    Create a column of strings from a column of numeric SSNs.
+
+    Parameters
+    -----------
+    ssns: a Series or array of numeric SSNs
+
+    Returns
+    -------
+    A Series with the SSNs as 9 character strings, zero-padded on the left,
+    and None for missing SSNs and for values that are not SSNs (negative,
+    more than 9 digits or not integers)
+    """
+    ssns = pd.Series(ssns).astype(float)
+    values = ssns.values
+    with np.errstate(invalid='ignore'):
+        valid = ((values >= 0) & (values < 10 ** 9) &
+                 (values == np.floor(values)))
+    ssns_str = np.full(ssns.shape[0], None, dtype=object)
+    # The 9 digits of each SSN, as ASCII characters
+    values = values[valid].astype(np.int64)
+    digits = values[:, np.newaxis] // 10 ** np.arange(8, -1, -1) % 10
+    digits = (digits + ord('0')).astype(np.uint8)
+    ssns_str[valid] = digits.view('S9').ravel().astype('U9')
+    return pd.Series(ssns_str, index=ssns.index)